@@ -0,0 +1,103 @@
+import os
+import hashlib
+import threading
+import numpy as np
+
+import xsection
+
+
+def default_cachedir():
+    # $XYS_CACHEDIR, else the user cache directory ($XDG_CACHE_HOME or ~/.cache)/xys
+    if os.environ.get('XYS_CACHEDIR'): return os.environ['XYS_CACHEDIR']
+    base=os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'),'.cache')
+    return os.path.join(base,'xys')
+
+
+# on-disk cache of attenuation arrays mu(E) (cm2/g)
+# one memory-mapped .npy file per (composition, cross section type, energy grid)
+class AttenuationCache(object):
+    def __init__(self, cachedir=None, max_bytes=2*1024**3):
+        self.cachedir=cachedir if cachedir is not None else default_cachedir()
+        self.max_bytes=max_bytes
+        self.hits=0
+        self.misses=0
+        self.lock=threading.Lock()# shared with worker threads
+        os.makedirs(self.cachedir, exist_ok=True)
+
+
+    def key(self,mat,enes,cstype,rtol=None):
+        zs,ws=xsection.decompose(mat)
+        enes=np.ascontiguousarray(enes,dtype=np.float64)
+        h=hashlib.sha1()
+        h.update(cstype.encode())
+        # direct xraylib or log-log interpolation within rtol
+        if rtol is not None: h.update(('loglog %g'%(rtol)).encode())
+        h.update(zs.tobytes())
+        h.update(np.round(ws,12).tobytes())
+        # energy grid definition: range, length and the exact grid points
+        h.update(np.array([enes[0],enes[-1],len(enes)],dtype=np.float64).tobytes())
+        h.update(enes.tobytes())
+        return h.hexdigest()
+
+
+    def cs_material(self,mat,enes,cstype='Total',rtol=None):
+        fname=os.path.join(self.cachedir,"%s.npy"%(self.key(mat,enes,cstype,rtol)))
+        with self.lock:
+            if os.path.exists(fname):
+                try:
+                    mu=np.load(fname,mmap_mode='r')
+                    os.utime(fname)# mark as recently used
+                    self.hits+=1
+                    return mu
+                except (OSError,ValueError):
+                    pass# broken file, recompute
+            self.misses+=1
+        if rtol is None:
+            mu=xsection.cs_material(mat,enes,cstype)
+        else:
+            mu=xsection.cs_material_loglog(mat,enes,cstype,rtol)
+        with self.lock:
+            tmpname="%s.%d.tmp"%(fname,os.getpid())
+            with open(tmpname,'wb') as f:
+                np.save(f,mu)
+            os.replace(tmpname,fname)
+            self._evict()
+        return mu
+
+
+    def evict(self):
+        with self.lock:
+            self._evict()
+
+
+    def _evict(self):
+        # least recently used files are removed until the cache fits in max_bytes
+        # (called with the lock held)
+        files=[os.path.join(self.cachedir,f) for f in os.listdir(self.cachedir) if f.endswith('.npy')]
+        stats=[]
+        for f in files:
+            try:
+                st=os.stat(f)
+            except OSError:
+                continue
+            stats.append((st.st_mtime,st.st_size,f))
+        total=sum(s[1] for s in stats)
+        for mtime,size,f in sorted(stats):
+            if total<=self.max_bytes: break
+            try:
+                os.remove(f)
+            except OSError:
+                continue
+            total-=size
+
+
+    def clear(self):
+        with self.lock:
+            for f in os.listdir(self.cachedir):
+                if f.endswith('.npy'): os.remove(os.path.join(self.cachedir,f))
+            self.hits=0
+            self.misses=0
+
+
+    def report(self):
+        return "attenuation cache: %d hits, %d misses (%s)"%(self.hits,self.misses,self.cachedir)
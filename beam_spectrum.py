@@ -0,0 +1,178 @@
+import os
+import numpy as np
+import pandas as pd
+import scipy.integrate
+
+import xraylib as xrl
+
+import xsection
+
+
+# polychromatic incident beam: energy bins (keV) and the fraction of the beam
+# flux in each bin (sum 1, so beamflux stays the total photon rate)
+# bem['spectrum'] (no key: monochromatic bem['beamene']):
+#   {'kind':'table','table':csv}  columns ev or kev, and flux (photons per bin,
+#                                 any unit) or the first other column
+#   {'kind':'tube','anode':'W','kV':50.,'window':'Be','window_um':127.,
+#    'takeoff':20.,'step':0.05}  built-in X-ray tube model
+# bem['beamene'] is then the highest incident energy (labels, catalog)
+
+# tube model (approximate, relative intensities only):
+# continuum: Kramers, 2.16e-7 Z (E0/E-1) photons/(electron keV sr)
+#            (Ebel's 1.35e9 per (mA s keV sr))
+#            generated uniformly down to 0.6 x the Kanaya-Okayama range
+# lines (after Ebel 1999): Bethe ionization cross section
+#        6.51e-20 n b ln(U)/(U Ec^2) cm2 with b=0.35 (K) and 0.25 (L),
+#        integrated over the electron slowing down (Bethe stopping power
+#        with Joy-Luo mean ionization energy), times Ebel's backscatter
+#        factor; L1/L2 vacancies partly moved to L2/L3 by Coster-Kronig
+#        transitions, then fluorescence yield and radiative rate; generated
+#        at the Love-Scott mean depth of each shell (absorption
+#        (1-exp(-2 chi rhoz))/(2 chi rhoz))
+# both absorbed in the anode along the take-off angle, then by the window
+KRAMERS=2.16e-7
+SHELLS={xrl.K_SHELL:(2,0.35,['KL3','KL2','KM3','KM2']),
+        xrl.L1_SHELL:(2,0.25,['L1M3','L1M2']),
+        xrl.L2_SHELL:(2,0.25,['L2M4','L2N4']),
+        xrl.L3_SHELL:(4,0.25,['L3M5','L3M4','L3N5','L3M1'])}
+# Coster-Kronig transfers (from, to, xraylib transition)
+COSTER_KRONIG=[(xrl.L1_SHELL,xrl.L2_SHELL,xrl.FL12_TRANS),
+               (xrl.L1_SHELL,xrl.L3_SHELL,xrl.FL13_TRANS),
+               (xrl.L2_SHELL,xrl.L3_SHELL,xrl.FL23_TRANS)]
+SPECTRA={}# table spectra by (path, mtime, size): an edited csv is read again
+
+
+def _kanaya_okayama(Z,A,E):
+    return 2.76e-6*A*np.power(E,1.67)/Z**0.889# g/cm2
+
+
+def _love_scott_depth(Z,A,E0,Ec):
+    # mean depth of the ionizations (g/cm2), Love and Scott as used by Ebel
+    J=0.0135*Z
+    U0=E0/Ec
+    rzm=A/Z*(0.787e-5*np.sqrt(J)*E0**1.5+0.735e-6*E0**2)
+    lz=np.log(Z)
+    eta=(0.1904-0.2236*lz+0.1292*lz**2-0.01491*lz**3)*E0**(0.1382-0.9211/np.sqrt(Z))
+    return rzm*(0.49269-1.0987*eta+0.78557*eta**2)*np.log(U0)/(0.70256-1.09865*eta+1.0046*eta**2+np.log(U0))
+
+
+def _backscatter(Z,E0,U0):
+    # fraction of the ionizations left after the backscattered electrons (Ebel)
+    return 1.-0.0081517*Z+3.613e-5*Z**2+0.009583*Z*np.exp(-U0)+0.001141*E0
+
+
+def _anode_absorption(anode,Z,A,enes,depth,sin_t):
+    chi=xsection.cs_material(anode,enes,'Total')/sin_t*depth
+    return np.where(chi>0.,-np.expm1(-chi)/np.where(chi>0.,chi,1.),1.)
+
+
+def tube(anode='W',kV=50.,window='Be',window_um=127.,takeoff=20.,step=0.05,low=1.):
+    # return: bin centres (keV) and fraction of the photons in each bin
+    Z=xrl.SymbolToAtomicNumber(anode)
+    A=xrl.AtomicWeight(Z)
+    mat=xrl.CompoundParser(anode)
+    sin_t=np.sin(np.pi/180.*takeoff)
+    edges=np.arange(low,kV+step/2.,step)
+    enes=0.5*(edges[1:]+edges[:-1])
+    depth=0.6*_kanaya_okayama(Z,A,kV)
+    counts=KRAMERS*Z*(kV/enes-1.)*step*_anode_absorption(mat,Z,A,enes,depth,sin_t)
+    J=(9.76*Z+58.5*Z**-0.19)*1e-3# keV
+    vacancies={}
+    for shell,(n,b,lines) in SHELLS.items():
+        Ec=xrl.EdgeEnergy(Z,shell)
+        if Ec>=kV:
+            vacancies[shell]=0.
+            continue
+        E=np.linspace(Ec,kV,257)
+        U=E/Ec
+        sigma=6.51e-20*n*b*np.log(U)/(U*Ec**2)
+        stopping=7.85e4*Z/(A*E)*np.log(1.166*E/J)# keV cm2/g
+        vacancies[shell]=xrl.AVOGNUM*1e24/A*scipy.integrate.trapezoid(sigma/stopping,E)/(4.*np.pi)*_backscatter(Z,kV,kV/Ec)
+    for src,dst,trans in COSTER_KRONIG:
+        try:
+            vacancies[dst]+=vacancies[src]*xrl.CosKronTransProb(Z,trans)
+        except ValueError:
+            pass
+    for shell,(n,b,lines) in SHELLS.items():
+        Ec=xrl.EdgeEnergy(Z,shell)
+        if vacancies[shell]<=0.: continue
+        try:
+            omega=xrl.FluorYield(Z,shell)
+        except ValueError:
+            continue
+        ldepth=2.*_love_scott_depth(Z,A,kV,Ec)
+        for name in lines:
+            line=getattr(xrl,name+'_LINE')
+            try:
+                e,p=xrl.LineEnergy(Z,line),xrl.RadRate(Z,line)
+            except ValueError:
+                continue
+            i=np.searchsorted(edges,e)-1
+            if i<0 or i>=len(enes): continue
+            counts[i]+=vacancies[shell]*omega*p*_anode_absorption(mat,Z,A,[e],ldepth,sin_t)[0]
+    if window and window_um>0.:
+        # element window (Be, Al, ...) at its bulk density
+        rho=xrl.ElementDensity(xrl.SymbolToAtomicNumber(window))
+        counts=counts*np.exp(-xsection.cs_material(xrl.CompoundParser(window),enes,'Total')*rho*window_um*1e-4)
+    return _normalized(enes,counts)
+
+
+def from_csv(fname):
+    df=pd.read_csv(fname)
+    enes=df['kev'].values if 'kev' in df.columns else df['ev'].values*1e-3
+    others=[c for c in df.columns if c not in ('kev','ev')]
+    vals=df['flux'].values if 'flux' in df.columns else df[others[0]].values
+    return _normalized(enes,vals)
+
+
+def _normalized(enes,counts):
+    enes,counts=np.asarray(enes,dtype=np.float64),np.asarray(counts,dtype=np.float64)
+    keep=(counts>0.) & (enes>0.)
+    enes,counts=enes[keep],counts[keep]
+    if len(enes)==0: raise ValueError("beam_spectrum: empty spectrum")
+    return enes,counts/np.sum(counts)
+
+
+def bins(bem,csvd="./csv/"):
+    # incident energies and weights of a beam dict
+    spec=bem.get('spectrum')
+    if not spec: return np.array([float(bem['beamene'])]),np.ones(1)
+    if spec['kind']=='tube':
+        return tube(**{k:v for k,v in spec.items() if k!='kind'})
+    if spec['kind']=='table':
+        key=table_stamp(spec,csvd)
+        if key not in SPECTRA: SPECTRA[key]=from_csv(key[0])
+        return SPECTRA[key]
+    raise ValueError("beam_spectrum: unknown kind %s"%(spec['kind']))
+
+
+def table_stamp(spec,csvd="./csv/"):
+    # path, modification time and size of a table spectrum (None otherwise)
+    if not spec or spec['kind']!='table': return None
+    fname=spec['table'] if os.path.exists(spec['table']) else os.path.join(csvd,spec['table'])
+    st=os.stat(fname)
+    return (os.path.abspath(fname),st.st_mtime_ns,st.st_size)
+
+
+def from_entry(entry):
+    # csv row beam_spectrum: tube,W,50[,Be,127[,20]] or table,file.csv
+    kind=str(entry[0]).strip()
+    if kind=='table': return {'kind':'table','table':str(entry[1]).strip()}
+    if kind!='tube': raise ValueError("beam_spectrum: unknown kind %s"%(kind))
+    spec={'kind':'tube','anode':str(entry[1]).strip(),'kV':float(entry[2])}
+    if len(entry)>3: spec['window']=str(entry[3]).strip()
+    if len(entry)>4: spec['window_um']=float(entry[4])
+    if len(entry)>5: spec['takeoff']=float(entry[5])
+    return spec
+
+
+def max_energy(spec,csvd="./csv/"):
+    return float(spec['kV']) if spec['kind']=='tube' else float(np.max(bins({'spectrum':spec},csvd)[0]))
+
+
+def label(bem):
+    spec=bem.get('spectrum')
+    if not spec: return "beam %.3f keV"%(bem['beamene'])
+    if spec['kind']=='tube':
+        return "%s tube %g kV"%(spec['anode'],spec['kV'])
+    return "beam %s"%(os.path.basename(spec['table']))
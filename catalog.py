@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import numpy as np
+
+import results
+import tabulated
+
+
+# local catalog of results: one npz (results.save) per configuration, named by
+# a hash of the canonical configuration (YieldModel.config), and an SQLite
+# table for lookup and queries
+# measured curves and tabulated beam spectra are hashed by their content, and
+# radionuclides by the activity at run time to 4 digits (see _key_config)
+class Catalog(object):
+    def __init__(self, dbname='./output/catalog.sqlite', datadir=None):
+        self.dbname=dbname
+        self.datadir=datadir if datadir is not None else os.path.join(os.path.dirname(dbname) or '.','catalog')
+        self.hits=0
+        self.misses=0
+        os.makedirs(self.datadir, exist_ok=True)
+        with self.connect() as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS runs(
+                          hash TEXT PRIMARY KEY, created TEXT, target TEXT, detectors TEXT,
+                          filters TEXT, beam_energy REAL, er_low REAL, er_high REAL,
+                          er_step REAL, file TEXT, config TEXT)''')
+
+
+    def connect(self):
+        # one connection per call: usable from worker threads and processes
+        return sqlite3.connect(self.dbname,timeout=30.)
+
+
+    def key(self,model):
+        h=hashlib.sha1()
+        h.update(json.dumps(_canonical(_key_config(model)),sort_keys=True,separators=(',',':')).encode())
+        return h.hexdigest()
+
+
+    def lookup(self,model):
+        # stored file of the configuration, None if not stored
+        with self.connect() as db:
+            row=db.execute('SELECT file FROM runs WHERE hash=?',(self.key(model),)).fetchone()
+        if row is None or not os.path.exists(row[0]): return None
+        return row[0]
+
+
+    def run(self,model,report=None):
+        # stored result of the configuration, computed and stored if new
+        # return: results.load dict
+        fname=self.lookup(model)
+        if fname is not None:
+            self.hits+=1
+            return results.load(fname)
+        self.misses+=1
+        return results.load(self.store(model,report=report))
+
+
+    def store(self,model,out=None,report=None):
+        key=self.key(model)
+        fname=os.path.abspath(os.path.join(self.datadir,"%s.npz"%(key)))
+        tmpname="%s.%d.tmp.npz"%(fname[:-4],os.getpid())
+        results.save(tmpname,model,out,report=report,verbose=False)
+        os.replace(tmpname,fname)
+        cfg=model.config()
+        with self.connect() as db:
+            db.execute('INSERT OR REPLACE INTO runs VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                       (key,time.strftime('%Y%m%d %H:%M:%S'),
+                        cfg['tgt'].get('name',''),
+                        ','.join([str(m.get('name','')) for m in cfg['dets']]),
+                        ','.join([str(m.get('name','')) for m in cfg['bets']]),
+                        cfg['bem'].get('beamene'),cfg['er_low'],cfg['er_high'],cfg['er_step'],
+                        fname,json.dumps(cfg,sort_keys=True)))
+        return fname
+
+
+    def query(self,target=None,detector=None,beam_energy=None,since=None,until=None,tol=1e-6):
+        # runs matching all given conditions, newest first
+        # target/detector: substring of the names, beam_energy: keV (within tol),
+        # since/until: dates as YYYYMMDD
+        conds,args=[],[]
+        if target is not None:
+            conds.append('target LIKE ?'); args.append('%%%s%%'%(target))
+        if detector is not None:
+            conds.append('detectors LIKE ?'); args.append('%%%s%%'%(detector))
+        if beam_energy is not None:
+            conds.append('ABS(beam_energy-?)<=?'); args+=[float(beam_energy),tol]
+        if since is not None:
+            conds.append('created>=?'); args.append(str(since))
+        if until is not None:
+            conds.append('created<?'); args.append('%s~'%(until))
+        sql='SELECT hash,created,target,detectors,filters,beam_energy,er_low,er_high,er_step,file FROM runs'
+        if len(conds)>0: sql+=' WHERE '+' AND '.join(conds)
+        with self.connect() as db:
+            rows=db.execute(sql+' ORDER BY created DESC',args).fetchall()
+        names=['hash','created','target','detectors','filters','beam_energy','er_low','er_high','er_step','file']
+        return [dict(zip(names,row)) for row in rows]
+
+
+    def export(self,model,fname,report=None):
+        # copy of the stored result (computed if new) as fname
+        src=self.lookup(model)
+        if src is not None:
+            self.hits+=1
+        else:
+            self.misses+=1
+            src=self.store(model,report=report)
+        shutil.copyfile(src,fname)
+        print("%s is created."%fname)
+        return fname
+
+
+    def report(self):
+        return "result catalog: %d hits, %d misses (%s)"%(self.hits,self.misses,self.dbname)
+
+
+def _key_config(model):
+    # configuration as hashed: curve layers and table beam spectra with a
+    # digest of their data (a name or path alone misses an edited file),
+    # radionuclides by activity, calibration date and the activity at run
+    # time to 4 digits instead of the exact decayed activity (changes every
+    # second; a stored result differs by less than 5e-5 in the source rates)
+    cfg=model.config()
+    for k in ['dets','bets']:
+        cfg[k]=[_with_curve(m,model.csvd) for m in cfg[k]]
+    spec=cfg['bem'].get('spectrum')
+    if spec and spec.get('kind')=='table':
+        cfg['bem']=dict(cfg['bem'],spectrum=dict(spec,digest=_digest(*model.beam_bins())))
+    cfg['rads']=[{'name':r['name'],'activity':r['activity'],'date':r['date'],
+                  'activitytoday':float('%.4g'%(r['activitytoday']))} for r in cfg['rads']]
+    return cfg
+
+
+def _with_curve(mat,csvd):
+    name=tabulated.table_name(mat)
+    if name is None: return mat
+    curve=tabulated.get(name,csvd)
+    return dict(mat,table_digest=_digest(curve.enes,curve.vals))
+
+
+def _digest(*arrays):
+    h=hashlib.sha1()
+    for a in arrays: h.update(np.ascontiguousarray(a,dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+def _canonical(obj):
+    # numbers as floats to 12 significant digits (same configuration, same hash)
+    if isinstance(obj,(int,float)) and not isinstance(obj,bool): return float('%.12g'%(obj))
+    if isinstance(obj,dict): return {k:_canonical(v) for k,v in obj.items()}
+    if isinstance(obj,list): return [_canonical(x) for x in obj]
+    return obj
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="list the runs stored in the result catalog")
+    parser.add_argument('--db',default='./output/catalog.sqlite',help="catalog file")
+    parser.add_argument('--target',help="target name contains")
+    parser.add_argument('--detector',help="detector name contains")
+    parser.add_argument('--beam',type=float,help="beam energy (keV)")
+    parser.add_argument('--since',help="date YYYYMMDD")
+    parser.add_argument('--until',help="date YYYYMMDD")
+    args=parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        sys.stderr.write('Error: no catalog %s\n'%(args.db))
+        return 1
+    rows=Catalog(args.db).query(args.target,args.detector,args.beam,args.since,args.until)
+    for r in rows:
+        print("%s %s target=%s detectors=%s filters=%s beam=%s keV range=%g-%g/%g %s"%(
+            r['hash'][:12],r['created'],r['target'],r['detectors'],r['filters'],r['beam_energy'],
+            r['er_low'],r['er_high'],r['er_step'],r['file']))
+    print("%d runs"%(len(rows)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
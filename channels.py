@@ -0,0 +1,95 @@
+import numpy as np
+
+import default
+
+
+# detector channel (ADC) binning of the model spectrum
+# energy of the lower edge of channel i: E(i) = c0 + c1 i + c2 i^2 + ... (keV)
+# (c0: offset, c1: gain keV/ch, higher terms: nonlinear calibration)
+class Channels(object):
+    def __init__(self, nch, coeffs):
+        self.nch=int(nch)
+        self.coeffs=[float(c) for c in coeffs]
+        if self.nch<=0 or len(self.coeffs)<2:
+            raise ValueError("channels: need nch>0 and at least offset, gain")
+        if np.any(np.diff(self.edges())<=0.):
+            raise ValueError("channels: calibration is not increasing")
+
+    @classmethod
+    def from_grid(cls, enes, step):
+        # one channel per grid point of a uniform grid (bins centred on the points)
+        return cls(len(enes),[enes[0]-step/2.,step])
+
+    @classmethod
+    def from_spec(cls, spec):
+        # spec (csv row 'adc_channels' or --channels): [nch,offset,gain,c2,...]
+        return cls(int(float(spec[0])),spec[1:])
+
+    def edges(self):
+        return np.polynomial.polynomial.polyval(np.arange(self.nch+1,dtype=np.float64),self.coeffs)
+
+    def centers(self):
+        e=self.edges()
+        return 0.5*(e[1:]+e[:-1])
+
+    def __repr__(self):
+        return "%d ch, "%(self.nch)+",".join(["%g"%c for c in self.coeffs])
+
+
+def rebin(enes, dens, edges):
+    # enes: model grid (keV), dens: spectrum per eV on the grid
+    # return: counts in each [edges[i],edges[i+1]) from the integral of the
+    #         piecewise linear spectrum (zero outside the grid), in one pass
+    enes=np.asarray(enes,dtype=np.float64)
+    dens=np.asarray(dens,dtype=np.float64)
+    cum=np.concatenate([[0.],np.cumsum(0.5*(dens[1:]+dens[:-1])*np.diff(enes)*1e3)])
+    # integral up to x inside a grid interval (linear density -> quadratic)
+    x=np.clip(np.asarray(edges,dtype=np.float64),enes[0],enes[-1])
+    i=np.clip(np.searchsorted(enes,x,side='right')-1,0,len(enes)-2)
+    h=(x-enes[i])*1e3
+    slope=(dens[i+1]-dens[i])/((enes[i+1]-enes[i])*1e3)
+    area=cum[i]+dens[i]*h+0.5*slope*h**2
+    return np.diff(area)
+
+
+def save_root(fname, ch, counts, extra=None):
+    # ROOT TH1D with the channel edges, filled in bulk (no per-bin loop)
+    # extra: {name:(x,y)} written as TGraphs
+    import ROOT
+    f_root=ROOT.TFile(fname,"recreate")
+    f_root.cd()
+    h=ROOT.TH1D("hfluor","hfluor;energy (keV);counts",ch.nch,ch.edges())
+    h.SetContent(np.concatenate([[0.],counts,[0.]]))# under/overflow
+    h.SetEntries(float(np.sum(counts)))
+    h.Write()
+    for name,(x,y) in (extra or {}).items():
+        x,y=np.ascontiguousarray(x,dtype=np.float64),np.ascontiguousarray(y,dtype=np.float64)
+        g=ROOT.TGraph(len(x),x,y)
+        g.SetNameTitle(name,name)
+        g.Write()
+    f_root.Close()
+    print("%s is created."%(fname))
+
+
+def save_npz(fname, ch, counts, extra=None):
+    # same content without ROOT: np.histogram-like (counts, edges) + calibration
+    arrs={'counts':counts,'edges':ch.edges(),'channel':np.arange(ch.nch),
+          'coeffs':np.array(ch.coeffs)}
+    for name,(x,y) in (extra or {}).items():
+        arrs[name+'_x'],arrs[name+'_y']=x,y
+    np.savez(fname,**arrs)
+    print("%s is created."%(fname))
+
+
+def save(base, ch, enes, dens, extra=None):
+    # base.root with PyROOT, base.npz otherwise; return the file name
+    counts=rebin(enes,dens,ch.edges())
+    try:
+        import ROOT
+    except ImportError:
+        fname=default.file_check(base+'.npz')
+        save_npz(fname,ch,counts,extra)
+        return fname
+    fname=default.file_check(base+'.root')
+    save_root(fname,ch,counts,extra)
+    return fname
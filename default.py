@@ -29,6 +29,23 @@ def save_numpy_arrays(enes,outs,fname):
     print("%s is created."%fname)
 
 
+def save_scan(beamenes,yields,labels,fname):
+    # beamenes: incident energies
+    # yields: (line x beam energy) yield map
+    # labels: line names for the header
+    fname=file_check(fname)
+    np.savetxt(fname, np.column_stack([beamenes,np.transpose(yields)]), delimiter=',', fmt='%1.6e',
+               header=','.join(['beam_energy']+list(labels)))
+    print("%s is created."%fname)
+
+
+def save_table(columns,fname):
+    # columns: name -> values (same length), e.g. line statistics
+    fname=file_check(fname)
+    pd.DataFrame(columns).to_csv(fname, index=False, float_format='%1.6e')
+    print("%s is created."%fname)
+
+
 def file_check(f):
     if os.path.exists(f):
         name,ext=os.path.splitext(f)
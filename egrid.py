@@ -0,0 +1,56 @@
+import numpy as np
+import scipy.interpolate
+
+
+# energy grids (keV)
+
+def uniform_grid(low,high,step):
+    # the uniform grid used so far by the GUI
+    low=max(low,0.1)
+    return np.arange(low,high+low+step,step)
+
+
+def adaptive_grid(low,high,step,centers=(),fwhms=(),edges=(),
+                  coarse_step=None,coarse_rtol=2e-3,nwidth=50.,dt=0.05,edge_rtol=1e-3,edge_pad=20):
+    # non-uniform grid, dense near line centres and absorption edges
+    # step:    finest spacing used away from lines (requested uniform step)
+    # centers: line centres (keV), fwhms: line FWHM incl. resolution (keV)
+    #          points at centre + fwhm/2 x sinh(t), |t|<=asinh(2 nwidth), dt apart
+    #          (spacing ~fwhm/40 at the centre, ~5% of the distance in the tails)
+    # edges:   absorption edges (keV), the uniform grid points within +-edge_pad
+    #          steps (the tabulated cross sections jump within ~1 eV of xraylib
+    #          EdgeEnergy), then geometric spacing from edge_rtol x E
+    # elsewhere: geometric spacing coarse_rtol x E (attenuation is smooth in
+    #            log E), between step and coarse_step (default: 100 x step)
+    low=max(low,0.1)
+    if coarse_step is None: coarse_step=100.*step
+    pts=[np.arange(low,high+coarse_step,coarse_step)]
+    elo=max(low,step/coarse_rtol)
+    ehi=min(high,coarse_step/coarse_rtol)
+    if elo<ehi: pts.append(np.exp(np.arange(np.log(elo),np.log(ehi),np.log1p(coarse_rtol))))
+    if low<elo: pts.append(np.arange(low,elo,step))
+    tmax=np.arcsinh(2.*nwidth)
+    ts=np.arange(-tmax,tmax+dt/2.,dt)
+    for c,w in zip(np.atleast_1d(centers),np.atleast_1d(fwhms)):
+        if w<=0.: w=step
+        pts.append(c+0.5*w*np.sinh(ts))
+    # just below/above each edge, then growing by a factor 2
+    nstep=int(np.ceil(np.log2(max(coarse_step/(edge_rtol*low),2.))))+1
+    rel=edge_rtol*2.**np.arange(nstep)
+    for e in np.atleast_1d(edges):
+        pts.append(e*(1.-1e-7)-e*rel)
+        pts.append(low+step*(np.round((e-low)/step)+np.arange(-edge_pad,edge_pad+1)))
+        pts.append(e*(1.+1e-7)+e*rel)
+    enes=np.concatenate(pts)
+    enes=np.unique(enes[(enes>=low) & (enes<=high)])
+    # drop points closer than 1e-9 relative (duplicates from overlapping pieces)
+    keep=np.concatenate([[True],np.diff(enes)>1e-9*enes[1:]])
+    return enes[keep]
+
+
+def resample(enes,vals,enes_new,kind='linear'):
+    # linear interpolation onto another grid (e.g., uniform grid for output)
+    # kind='cubic': cubic spline, for smooth curves sampled coarsely
+    if kind=='cubic':
+        return scipy.interpolate.CubicSpline(enes,vals,extrapolate=False)(np.clip(enes_new,enes[0],enes[-1]))
+    return np.interp(enes_new,enes,vals)
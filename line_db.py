@@ -0,0 +1,129 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+import xraylib as xrl
+
+import line_wrap
+
+
+# precomputed atomic line table: Z=1..ZMAX x all IUPAC lines of IUPAC_macro.csv
+# arrays are indexed [Z, line column] (row 0 unused) and built once from
+# xraylib, then stored as a compressed npz next to IUPAC_macro.csv
+ZMAX=107
+FNAME='line_db.npz'
+FORMAT=2# bump when build() changes, stored tables are then rebuilt
+FIELDS=['energy',# keV, LineEnergy (0: no line)
+        'width',# keV, natural width as line_wrap.get_linewidth
+        'width_initial','width_final',# keV, AtomicLevelWidth of the two vacancies
+        'fluor_yield',# FluorYield of the initial shell
+        'rad_rate',# RadRate of the line
+        'edge']# keV, EdgeEnergy of the initial shell
+
+
+class LineDB(object):
+    def __init__(self, macros, arrays):
+        self.macros=np.array([str(m) for m in macros])# e.g. KL3_LINE
+        self.linetypes=np.array([m.split('_')[0] for m in self.macros])
+        self.lines=np.array([xrl.__getattribute__(m) for m in self.macros],dtype=np.int64)
+        self.col_of_line={int(l):j for j,l in enumerate(self.lines)}
+        self.col_of_type={lt:j for j,lt in enumerate(self.linetypes)}
+        for f in FIELDS:
+            setattr(self,f,arrays[f])
+
+
+    def cols(self,lines):
+        # columns of xraylib line constants (e.g. xrl.KL3_LINE)
+        return np.array([self.col_of_line[int(l)] for l in np.atleast_1d(lines)],dtype=np.int64)
+
+
+    def cols_of_types(self,linetypes):
+        # columns of IUPAC line types (e.g. 'KL3')
+        return np.array([self.col_of_type[lt] for lt in np.atleast_1d(linetypes)],dtype=np.int64)
+
+
+    def lookup(self,field,zs,lines):
+        # field values for every (line, z), shape (len(lines),len(zs))
+        zs=np.atleast_1d(np.asarray(zs,dtype=np.int64))
+        return getattr(self,field)[zs[np.newaxis,:],self.cols(lines)[:,np.newaxis]]
+
+
+    def line_energy(self,z,line):
+        # same as line_wrap.get_lineenergy
+        if not 0<z<=ZMAX or int(line) not in self.col_of_line: return 0.
+        return self.energy[z,self.col_of_line[int(line)]]
+
+
+def _call(func,*args):
+    try:
+        return func(*args)
+    except:
+        return 0.
+
+
+def build(csvd="./csv/"):
+    macros=pd.read_csv(csvd+"IUPAC_macro.csv")['IUPAC_macro'].values
+    shape=(ZMAX+1,len(macros))
+    arrays={f:np.zeros(shape,dtype=np.float64) for f in FIELDS}
+    for j,mac in enumerate(macros):
+        line=xrl.__getattribute__(mac)
+        lt=mac.split('_')[0]
+        try:
+            sh_e,sh_b=line_wrap.line_shells(lt)
+        except AttributeError:# KO, KP: sums over the O, P subshells, width of K only
+            sh_e,sh_b=xrl.K_SHELL,None
+        for z in range(1,ZMAX+1):
+            arrays['energy'][z,j]=line_wrap.get_lineenergy(z,line)
+            arrays['rad_rate'][z,j]=_call(xrl.RadRate,z,line)
+            arrays['width_initial'][z,j]=_call(xrl.AtomicLevelWidth,z,sh_e)
+            if sh_b is None:
+                arrays['width'][z,j]=arrays['width_initial'][z,j]
+            else:
+                arrays['width'][z,j]=line_wrap.get_linewidth(z,lt)
+                arrays['width_final'][z,j]=_call(xrl.AtomicLevelWidth,z,sh_b)
+            arrays['fluor_yield'][z,j]=_call(xrl.FluorYield,z,sh_e)
+            arrays['edge'][z,j]=_call(xrl.EdgeEnergy,z,sh_e)
+    return LineDB(macros,arrays)
+
+
+def save(db,fname):
+    tmpname="%s.%d.tmp"%(fname,os.getpid())
+    with open(tmpname,'wb') as f:
+        np.savez_compressed(f,macros=db.macros,xraylib_version=xrl.__version__,format=FORMAT,
+                            **{f:getattr(db,f) for f in FIELDS})
+    os.replace(tmpname,fname)
+
+
+_loaded={}
+
+
+def load(csvd="./csv/"):
+    # table of csvd, read from csvd/line_db.npz or built (and saved) when the
+    # file is missing or made with another xraylib version or format
+    if csvd in _loaded: return _loaded[csvd]
+    fname=os.path.join(csvd,FNAME)
+    db=None
+    if os.path.exists(fname):
+        try:
+            with np.load(fname) as d:
+                if str(d['xraylib_version'])==xrl.__version__ and 'format' in d and int(d['format'])==FORMAT:
+                    db=LineDB(d['macros'],{f:d[f] for f in FIELDS})
+        except (OSError,ValueError,KeyError):
+            db=None# broken file, rebuild
+    if db is None:
+        db=build(csvd)
+        try:
+            save(db,fname)
+        except OSError as e:
+            sys.stderr.write('Warning: line_db, cannot write %s (%s)\n'%(fname,e))
+    _loaded[csvd]=db
+    return db
+
+
+if __name__ == "__main__":
+    # python line_db.py [csv directory]: rebuild the table
+    csvd=sys.argv[1] if len(sys.argv)>1 else "./csv/"
+    db=build(csvd)
+    save(db,os.path.join(csvd,FNAME))
+    print("%s is created (%d elements x %d lines)."%(os.path.join(csvd,FNAME),ZMAX,len(db.macros)))
@@ -1,12 +1,11 @@
 import sys,os
 
 import itertools
-import numpy as np
-from numpy.fft import _pocketfft_internal as pfi
-
 import numpy as np
 import scipy as sp
+import scipy.fft
 import scipy.special
+import scipy.signal
 
 import xraylib as xrl
 
@@ -33,9 +32,114 @@ def voigt(x, mean, hwhm, sigma):
     return (w.real)/(sigma * _sqrt2pi)
 
 
-# basically from Ichinohe-san
-def get_linewidth(z,linetype):
-    _e,_b='',''
+# FWHM of the Voigt profile (Olivero & Longbothum 1977), same unit as hwhm/sigma
+def voigt_fwhm(hwhm, sigma):
+    fl=2.*np.asarray(hwhm,dtype=np.float64)
+    fg=2.*np.sqrt(2.*np.log(2))*np.asarray(sigma,dtype=np.float64)
+    return 0.5346*fl + np.sqrt(0.2166*fl**2 + fg**2)
+
+
+# upper bound of the fraction of the line area outside +-window*FWHM
+# P(|L+G|>W) <= P(|L|>W/2) + P(|G|>W/2)
+def voigt_window_error(hwhm, sigma, window):
+    hwhm,sigma=np.broadcast_arrays(np.asarray(hwhm,dtype=np.float64),np.asarray(sigma,dtype=np.float64))
+    half=0.5*window*voigt_fwhm(hwhm,sigma)
+    err=np.zeros(hwhm.shape)
+    l=hwhm>0.
+    err[l]+=1.-2./np.pi*np.arctan(half[l]/hwhm[l])
+    g=sigma>0.
+    err[g]+=scipy.special.erfc(half[g]/(sigma[g]*_sqrt2))
+    return err
+
+
+# sum of many Voigt profiles: sum_i norms[i]*voigt(x,means[i],hwhms[i],sigmas[i])
+# window: None evaluates every line on the whole grid, one line at a time
+#         (batching the Faddeeva function over lines is no faster); if given, each line is evaluated only within +-window*FWHM(Voigt)
+#         of its centre (x must be sorted); outside the window
+#         tail='lorentz' uses the Lorentzian asymptote hwhm/pi/(x-mean)^2
+#         (all lines at once, see _lorentz_tails),
+#         tail='cut' drops the line (see voigt_window_error for the lost area)
+def voigt_sum(x, means, hwhms, sigmas, norms, window=None, tail='lorentz'):
+    x=np.asarray(x,dtype=np.float64)
+    means,hwhms,sigmas,norms=np.broadcast_arrays(*[np.asarray(a,dtype=np.float64) for a in (means,hwhms,sigmas,norms)])
+    out=np.zeros_like(x)
+    if len(means)==0: return out
+    if np.any((hwhms==0.) & (sigmas==0.)):
+        print("Warning: voigt_sum, sigma=0 and hwhm=0")
+    if window is not None:
+        return _voigt_sum_window(x,means,hwhms,sigmas,norms,window,tail,out)
+    for i in range(len(means)):
+        if sigmas[i]==0. and hwhms[i]==0.: continue
+        out+=norms[i]*voigt(x,means[i],hwhms[i],sigmas[i])
+    return out
+
+
+def _voigt_sum_window(x, means, hwhms, sigmas, norms, window, tail, out):
+    if tail not in ['lorentz','cut']:
+        raise ValueError("voigt_sum: unknown tail %s"%(tail))
+    half=window*voigt_fwhm(hwhms,sigmas)
+    los=np.searchsorted(x,means-half,side='left')
+    his=np.searchsorted(x,means+half,side='right')
+    if tail=='lorentz': _lorentz_tails(x,means,hwhms,norms,half,out)
+    for i in np.where(his>los)[0]:
+        if sigmas[i]==0. and hwhms[i]==0.: continue
+        lo,hi=los[i],his[i]
+        out[lo:hi]+=norms[i]*voigt(x[lo:hi],means[i],hwhms[i],sigmas[i])
+    return out
+
+
+def _lorentz_tails(x, means, hwhms, norms, half, out):
+    # sum of the Lorentzian asymptotes norm*hwhm/pi/(x-mean)^2 outside +-half
+    # of every line, without a lines x grid loop:
+    # the sticks norm*hwhm/pi are deposited on a coarse uniform grid (step
+    # <= 1/8 of the narrowest window) and convolved once with 1/(pi d^2) by
+    # FFT, interpolated onto x, and replaced by the exact asymptote within
+    # max(half,6 steps)+2 steps of each line (cost: coarse grid log + window
+    # widths); the interpolation error further out is below 1% of the tail
+    ls=np.where(hwhms>0.)[0]
+    if len(ls)==0 or len(x)<2: return out
+    means,half,amps=means[ls],half[ls],norms[ls]*hwhms[ls]/np.pi
+    step=max(np.min(half)/8.,(x[-1]-x[0])/len(x))
+    near_r=np.maximum(half,6.*step)+2.*step
+    margin=np.max(near_r)
+    lo=x[0]-margin
+    nc=int(np.ceil((x[-1]+margin-lo)/step))+1
+    xc=lo+step*np.arange(nc)
+    near=(means>=xc[0]) & (means<=xc[-2])
+    # lines far outside the grid: smooth there, directly on the coarse grid
+    tails=np.zeros(nc)
+    for i in np.where(~near)[0]: tails+=amps[i]/(xc-means[i])**2
+    # lines on the coarse grid: sticks split between the two nearest nodes
+    pos=(means[near]-lo)/step
+    j=np.floor(pos).astype(np.int64)
+    f=pos-j
+    dep=np.zeros(nc)
+    np.add.at(dep,j,amps[near]*(1.-f))
+    np.add.at(dep,j+1,amps[near]*f)
+    k=np.arange(-(nc-1),nc,dtype=np.float64)*step
+    kern=np.where(k!=0.,1./np.where(k!=0.,k,1.)**2,0.)
+    tails+=scipy.signal.fftconvolve(dep,kern)[nc-1:2*nc-1]
+    out+=np.interp(x,xc,tails)
+    # exact asymptote near each line instead of its coarse approximation
+    for i,ji,fi in zip(np.where(near)[0],j,f):
+        m,h,a=means[i],half[i],amps[i]
+        r0=np.searchsorted(x,m-near_r[i],side='left')
+        r1=np.searchsorted(x,m+near_r[i],side='right')
+        if r1<=r0: continue
+        c0=max(int(np.floor((x[r0]-lo)/step)),0)
+        c1=min(int(np.ceil((x[r1-1]-lo)/step))+1,nc)
+        nodes=np.arange(c0,c1)
+        d0,d1=(nodes-ji)*step,(nodes-ji-1)*step
+        coarse=a*((1.-fi)*np.where(d0!=0.,1./np.where(d0!=0.,d0,1.)**2,0.)+
+                  fi*np.where(d1!=0.,1./np.where(d1!=0.,d1,1.)**2,0.))
+        d=x[r0:r1]-m
+        exact=np.where(np.abs(d)>h,a/np.where(d!=0.,d,1.)**2,0.)
+        out[r0:r1]+=exact-np.interp(x[r0:r1],xc[nodes],coarse)
+    return out
+
+
+# shells of the initial and final vacancies of an IUPAC line type (e.g. KL3, L3M5)
+def line_shells(linetype):
     if 'K'==linetype[0]:
         _e=xrl.K_SHELL
         if len(linetype[1:])==3:
@@ -48,6 +152,12 @@ def get_linewidth(z,linetype):
             _b=xrl.__getattribute__('%s_SHELL'%(linetype[2:-1]))
         else:
             _b=xrl.__getattribute__('%s_SHELL'%(linetype[2:]))
+    return _e,_b
+
+
+# basically from Ichinohe-san
+def get_linewidth(z,linetype):
+    _e,_b=line_shells(linetype)
     try:
         we=xrl.AtomicLevelWidth(z,_e)
     except:
@@ -70,26 +180,112 @@ def get_lineenergy(z,line):
     return ene
 
 
-## from Ichinohe-san
-#def gen_voigt_tail(L=800.0,nbin=2048):
-#    dL=L/nbin
-#    lenxs=2*nbin
-#    xs=(np.arange(lenxs)-nbin)*dL
-#    ks=np.arange(0,nbin+1)/L*3.14159265
-#    z=np.zeros(lenxs,'D')
-#    lenxs_inv=1/lenxs
-#        
-#    def func(x,mu,gauss_sigma,lorentz_gamma,norm,tail_tau=0.0,tail_frac=0.0):
-#        fGfL=np.exp(-0.5*(gauss_sigma*ks)**2-lorentz_gamma*ks)
-#        fT=1/(1-1j*ks*tail_tau)
-#        z[0:nbin+1]=fGfL*((1-tail_frac)+tail_frac*fT)
-#        glt=pfi.execute(z,True,False,lenxs_inv) / dL
-#        return np.interp(x,xs+mu,np.concatenate([glt[-nbin:],glt[:-nbin]]),
-#                         left=0.0,right=0.0)*norm
-#
-#    return func
-#
+# spectrum of many lines by FFT convolution, basically from gen_voigt_tail
+# by Ichinohe-san: the lines are put as sticks on a uniform grid and
+# convolved once with the detector response
+#   Gaussian(sigma) x ((1-tail_frac) + tail_frac x exponential low-energy tail(tail_tau))
+# and the natural Lorentzian width. Lines are grouped by Gaussian sigma and
+# Lorentzian width (relative tolerance rtol), one FFT convolution per group.
+# x: grid (any spacing, sorted), units of means/hwhms/sigmas/tail_tau same as x
+# sigmas: one value or one per line (energy dependent resolution)
+# (for a non-uniform x the working step is the smallest spacing, limited to
+#  max_points points over the range, and the result is interpolated back)
+# pad: padding against wrap-around in FWHM of the widest line (plus 30 tail_tau),
+# the wrapped Lorentzian tails are removed analytically (_remove_lorentz_images);
+# lines beyond the padding only add their Lorentzian asymptote (_lorentz_tails)
+def fft_spectrum(x, means, hwhms, norms, sigmas, tail_tau=0.0, tail_frac=0.0, rtol=0.02,
+                 max_points=2**22, pad=50.):
+    x=np.asarray(x,dtype=np.float64)
+    means,hwhms,norms,sigmas=np.broadcast_arrays(*[np.asarray(a,dtype=np.float64) for a in (means,hwhms,norms,sigmas)])
+    if len(means)==0 or len(x)<2: return np.zeros_like(x)
+    # uniform working grid with padding against wrap-around
+    dxs=np.diff(x)
+    dx=max(np.min(dxs[dxs>0.]),(x[-1]-x[0])/max_points)
+    uniform=np.allclose(dxs,dx,rtol=1e-6,atol=0.)
+    nx=int(round((x[-1]-x[0])/dx))+1
+    width=pad*np.max(voigt_fwhm(hwhms,sigmas))
+    if tail_frac>0. and tail_tau>0.: width+=30.*tail_tau
+    npad=min(int(np.ceil(width/dx))+4,nx)
+    nfft=sp.fft.next_fast_len(nx+2*npad,real=True)
+    x0=x[0]-npad*dx
+    ks=2.*np.pi*np.fft.rfftfreq(nfft,dx)
+    tail=1.
+    if tail_frac>0. and tail_tau>0.:
+        tail=(1.-tail_frac)+tail_frac/(1.-1j*ks*tail_tau)
+    out=np.zeros(nfft,dtype=np.float64)
+    u=(means-x0)/dx
+    inside=(u>=1.) & (u<nfft-2)
+    far=[a[~inside] for a in (means,hwhms,norms)]
+    means,hwhms,norms,sigmas=means[inside],hwhms[inside],norms[inside],sigmas[inside]
+    for sgroup in group_widths(sigmas,rtol):
+        resp=tail*np.exp(-0.5*(np.mean(sigmas[sgroup])*ks)**2)
+        for hgroup in group_widths(hwhms[sgroup],rtol):
+            group=sgroup[hgroup]
+            sticks=_deposit_sticks(means[group],norms[group],x0,dx,nfft)
+            kern=resp*np.exp(-np.mean(hwhms[group])*ks)
+            out+=np.fft.irfft(np.fft.rfft(sticks)*kern,nfft)
+    out/=dx# per unit of x
+    out=out[npad:npad+len(x)].copy() if uniform else np.interp(x,x0+np.arange(nfft)*dx,out)
+    _remove_lorentz_images(x,means,hwhms,norms,nfft*dx,npad*dx,out)
+    if len(far[0])>0: _lorentz_tails(x,*far,np.zeros(len(far[0])),out)
+    return out
+
+
+def _remove_lorentz_images(x, means, hwhms, norms, period, margin, out):
+    # the circular convolution adds the periodic images of each Lorentzian
+    # tail, sum_{n!=0} hwhm/pi/(d+n period)^2
+    #   = hwhm/pi ((pi/period)^2/sin^2(pi d/period) - 1/d^2)
+    # smooth on the grid (the images are more than margin away), so it is
+    # evaluated on a coarse grid and interpolated
+    ls=np.where(hwhms>0.)[0]
+    if len(ls)==0: return out
+    nc=int(np.ceil(8.*(x[-1]-x[0])/margin))+2
+    xc=np.linspace(x[0],x[-1],nc)
+    images=np.zeros(nc)
+    c=np.pi/period
+    nblock=max(1,int(2**22/nc))
+    for k in range(0,len(ls),nblock):
+        l=ls[k:k+nblock]
+        t=c*(xc[np.newaxis,:]-means[l,np.newaxis])
+        small=np.abs(t)<1e-3
+        ts=np.where(small,1.,t)
+        g=np.where(small,1./3.+t**2/15.,1./np.sin(ts)**2-1./ts**2)*c**2
+        images+=np.dot(norms[l]*hwhms[l]/np.pi,g)
+    out-=np.interp(x,xc,images)
+    return out
+
+
+def group_widths(widths, rtol):
+    # indices of lines with close widths (within rtol of the narrowest one
+    # of each group), zero widths together
+    widths=np.asarray(widths,dtype=np.float64)
+    groups=[]
+    zero=np.where(widths<=0.)[0]
+    if len(zero)>0: groups.append(zero)
+    pos=np.where(widths>0.)[0]
+    if len(pos)==0: return groups
+    order=pos[np.argsort(widths[pos],kind='stable')]
+    start=0
+    for i in range(1,len(order)+1):
+        if i==len(order) or widths[order[i]]>widths[order[start]]*(1.+rtol):
+            groups.append(order[start:i])
+            start=i
+    return groups
+
 
+def _deposit_sticks(means, norms, x0, dx, n):
+    # 4-point Lagrange weights on the neighbouring bins: area, centroid and
+    # the next two moments of each stick are kept, so the sub-bin position
+    # does not broaden the lines
+    u=(means-x0)/dx
+    i=np.floor(u).astype(np.int64)
+    f=u-i
+    ws=[-f*(f-1.)*(f-2.)/6., (f+1.)*(f-1.)*(f-2.)/2., -(f+1.)*f*(f-2.)/2., (f+1.)*f*(f-1.)/6.]
+    sticks=np.zeros(n,dtype=np.float64)
+    ok=(i>=1) & (i<n-2)
+    for j,w in zip(range(-1,3),ws):
+        sticks+=np.bincount(i[ok]+j,weights=norms[ok]*w[ok],minlength=n)[:n]
+    return sticks
 
 
 ## http://www011.upp.so-net.ne.jp/dhistory/PytnPageQT02-05.html
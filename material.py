@@ -9,6 +9,10 @@ from datetime import datetime
 
 import xraylib as xrl
 
+import tabulated
+import beam_spectrum
+import yield_model
+
 
 class MaterialTabWidget(QWidget):
     def __init__(self, parent=None, name=""):
@@ -58,9 +62,17 @@ class MaterialTabWidget(QWidget):
         self.removeButton.clicked.connect(self.remove_material)
         ly1=QHBoxLayout()
         ly1.addWidget(self.addButton)
-        if self.name=='bet' or self.name=='det' or self.name=='rad':
+        if self.name=='tgt':
+            # layered target: Set for the top layer, Add layer for the ones below
+            self.layerButton = QPushButton("Add layer")
+            self.layerButton.clicked.connect(lambda: self.add_material(layer=True))
+            ly1.addWidget(self.layerButton)
+        if self.name=='bet' or self.name=='det' or self.name=='rad' or self.name=='tgt':
             ly1.addWidget(self.removeButton)
         ly1.addWidget(self.resetButton)
+        # measured transmission (filter) or QE (detector) curve
+        self.tableButton = QPushButton("Add table (csv)")
+        self.tableButton.clicked.connect(self.open_table)
 
         # thickness & density
         self.mat_thick_le = QLineEdit()
@@ -111,6 +123,26 @@ class MaterialTabWidget(QWidget):
         self.bem_time_le.setValidator(QDoubleValidator(0,1e30,999))
         self.bem_time_le.setText("7200.")# 2 hours
         self.bem_time_le.returnPressed.connect(self.apply_beam_time)
+        # incident spectrum: monochromatic (incident energy), tube model or csv
+        self.SPECTRUM_KINDS=["Monochromatic","X-ray tube","Table (csv)"]
+        self.bem_spec_cb = QComboBox()
+        self.bem_spec_cb.addItems(self.SPECTRUM_KINDS)
+        self.bem_anode_le = QLineEdit()
+        self.bem_anode_le.setText("W")
+        self.bem_kv_le = QLineEdit()
+        self.bem_kv_le.setValidator(QDoubleValidator(1.,1e3,999))
+        self.bem_kv_le.setText("50.")
+        self.bem_window_le = QLineEdit()
+        self.bem_window_le.setText("Be")
+        self.bem_window_um_le = QLineEdit()
+        self.bem_window_um_le.setValidator(QDoubleValidator(0.,1e5,999))
+        self.bem_window_um_le.setText("127.")
+        self.bem_takeoff_le = QLineEdit()
+        self.bem_takeoff_le.setValidator(QDoubleValidator(0.1,90.,999))
+        self.bem_takeoff_le.setText("20.")
+        self.bem_spec_file=""
+        self.specButton = QPushButton("Open spectrum (csv)")
+        self.specButton.clicked.connect(self.open_spectrum)
 
         self.ra_cb = QComboBox()
         self.ra_cb.addItem("None")
@@ -162,7 +194,22 @@ class MaterialTabWidget(QWidget):
             ly6=QHBoxLayout(beambw)
             ly6.addWidget(QLabel("Outgoing angle (degree):"))
             ly6.addWidget(self.bem_beambeta_le)
+            beamsw=QWidget()
+            ly8=QHBoxLayout(beamsw)
+            ly8.addWidget(QLabel("Spectrum:"))
+            ly8.addWidget(self.bem_spec_cb)
+            ly8.addWidget(self.specButton)
+            beamtw=QWidget()
+            ly9=QHBoxLayout(beamtw)
+            ly9.addWidget(QLabel("Tube anode, kV, window, um, takeoff (degree):"))
+            ly9.addWidget(self.bem_anode_le)
+            ly9.addWidget(self.bem_kv_le)
+            ly9.addWidget(self.bem_window_le)
+            ly9.addWidget(self.bem_window_um_le)
+            ly9.addWidget(self.bem_takeoff_le)
             beambox.addWidget(beamew)
+            beambox.addWidget(beamsw)
+            beambox.addWidget(beamtw)
             beambox.addWidget(beamfw)
             beambox.addWidget(beamaw)
             beambox.addWidget(beambw)
@@ -243,6 +290,7 @@ class MaterialTabWidget(QWidget):
             self.chkbox_luxelht.stateChanged.connect(self.chkbox_luxelht_action)
             self.chkbox_luxelht.setChecked(False)
             main_layout.addWidget(self.chkbox_luxelht)
+            main_layout.addWidget(self.tableButton)
             
             
         else:
@@ -255,6 +303,7 @@ class MaterialTabWidget(QWidget):
             main_layout.addWidget(self.nist_cb)
             main_layout.addWidget(QLabel("Compound parser (e.g., CdTe) press return"))
             main_layout.addWidget(self.cp_le)
+            if self.name=='det': main_layout.addWidget(self.tableButton)
             #main_layout.addWidget(self.mat_table) 
             
         self.setLayout(main_layout)
@@ -262,6 +311,7 @@ class MaterialTabWidget(QWidget):
 
     def add_beam(self):
         self.apply_beamene()
+        self.apply_spectrum()
         self.apply_beamalpha()
         self.apply_beambeta()
         self.apply_beamflux()
@@ -281,20 +331,28 @@ class MaterialTabWidget(QWidget):
         self.parent.rads.append(copy.deepcopy(self.rad))
         self.parent.update_line_table()
 
-    def _add_target(self):
-        self.parent.tgt=copy.deepcopy(self.mat)            
-        self.parent.update_line_table()
+    def _add_target(self,layer=False):
+        # layer: one more layer below the current ones (else the only layer)
+        if not layer or len(self.parent.tgts)==0:
+            items = self.parent.cc_table.findItems("%s"%(self.TARGET_STR), Qt.MatchStartsWith)
+            for item in items: self.parent.cc_table.removeRow(item.row())
+            self.parent.tgts=[]
+        self.parent.tgts.append(copy.deepcopy(self.mat))
+        self._set_target()
         row=self.parent.cc_table.rowCount()
-        items = self.parent.cc_table.findItems("%s 1"%(self.TARGET_STR), Qt.MatchExactly)
-        if items:
-            row=items[0].row()
-        else:
-            self.parent.cc_table.insertRow(row)
-        self.parent.cc_table.setItem(row,0, QTableWidgetItem("%s 1"%(self.TARGET_STR)))
+        self.parent.cc_table.insertRow(row)
+        self.parent.cc_table.setItem(row,0, QTableWidgetItem("%s %d"%(self.TARGET_STR,len(self.parent.tgts))))
         self.parent.cc_table.setItem(row,1, QTableWidgetItem(str(self.mat['thickness'])))
         self.parent.cc_table.setItem(row,2, QTableWidgetItem(str(self.mat['density'])))
         self.parent.cc_table.setItem(row,3, QTableWidgetItem(self.mat['name']))        
     
+    def _set_target(self):
+        tgts=self.parent.tgts
+        if len(tgts)==0: self.parent.tgt={}
+        elif len(tgts)==1: self.parent.tgt=copy.deepcopy(tgts[0])
+        else: self.parent.tgt=yield_model.stack_spec(tgts)
+        self.parent.update_line_table()
+
     def _add_detector(self):
         self.parent.det=copy.deepcopy(self.mat)
         self.parent.dets.append(copy.deepcopy(self.mat))
@@ -316,7 +374,7 @@ class MaterialTabWidget(QWidget):
         self.parent.cc_table.setItem(row,3, QTableWidgetItem(self.mat['name']))
 
         
-    def add_material(self):
+    def add_material(self,layer=False):
         if "name" not in [*self.mat.keys()]:
             sys.stderr.write('Error: add_material, no material selected\n')
             return
@@ -328,7 +386,7 @@ class MaterialTabWidget(QWidget):
         if self.mat['density']<=0:
             sys.stderr.write('Error: add_material, density should be a positive value\n')
             return
-        if self.name=='tgt':   self._add_target()
+        if self.name=='tgt':   self._add_target(layer)
         elif self.name=='det': self._add_detector()
         elif self.name=='bet': self._add_filter_materials()
                     
@@ -363,6 +421,15 @@ class MaterialTabWidget(QWidget):
                 return
             #print("removed parent.det=",self.parent.dets[-1])
             del self.parent.dets[-1]
+        elif self.name=='tgt':
+            r=len(self.parent.tgts)
+            if r==0:
+                sys.stderr.write('Warning: no target\n')
+                return
+            items = self.parent.cc_table.findItems("%s %d"%(self.TARGET_STR,r), Qt.MatchExactly)
+            for item in items: self.parent.cc_table.removeRow(item.row())
+            del self.parent.tgts[-1]
+            self._set_target()
         elif self.name=='rad':
             r=len(self.parent.rads)
             items = self.parent.line_table.findItems("%s %d"%(self.RADIONUCL_STR,r), Qt.MatchExactly)
@@ -390,6 +457,7 @@ class MaterialTabWidget(QWidget):
             return
         if self.name=='tgt':
             self.parent.tgt={}
+            self.parent.tgts=[]
             items = self.parent.cc_table.findItems("%s"%(self.TARGET_STR), Qt.MatchStartsWith)
         elif self.name=='det':
             self.parent.det={}
@@ -445,6 +513,38 @@ class MaterialTabWidget(QWidget):
             self.bem['beamene']=20.
         
 
+    def apply_spectrum(self):
+        # polychromatic beam: beamene becomes the highest incident energy
+        kind=self.bem_spec_cb.currentIndex()
+        self.bem.pop('spectrum',None)
+        try:
+            if kind==1:
+                self.bem['spectrum']={'kind':'tube','anode':self.bem_anode_le.text().strip(),
+                                      'kV':float(self.bem_kv_le.text()),
+                                      'window':self.bem_window_le.text().strip(),
+                                      'window_um':float(self.bem_window_um_le.text() or 0.),
+                                      'takeoff':float(self.bem_takeoff_le.text() or 20.)}
+            elif kind==2:
+                self.bem['spectrum']={'kind':'table','table':self.bem_spec_file}
+            if 'spectrum' in self.bem:
+                self.bem['beamene']=beam_spectrum.max_energy(self.bem['spectrum'],self.parent.csvd)
+        except (OSError,KeyError,ValueError) as e:
+            sys.stderr.write('Error: apply_spectrum, %s\n'%(e))
+            self.bem.pop('spectrum',None)
+            self.bem_spec_cb.setCurrentIndex(0)
+            self.apply_beamene()
+
+
+    def open_spectrum(self):
+        # csv with columns ev or kev, and flux per bin
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        fileName, _ = QFileDialog.getOpenFileName(self,"QFileDialog.getOpenFileName()", "","csv Files (*.csv);;All Files (*)", options=options)
+        if not fileName: return
+        self.bem_spec_file=fileName
+        self.bem_spec_cb.setCurrentIndex(self.SPECTRUM_KINDS.index("Table (csv)"))
+
+
     def apply_beamalpha(self):
         s=self.bem_beamalpha_le.text()
         if s!="":
@@ -639,7 +739,7 @@ class MaterialTabWidget(QWidget):
     def ra_select(self):
         r=self.ra_cb.currentIndex()
         if r>0:
-            self.rad=xrl.GetRadioNuclideDataByIndex(r-1)
+            self.rad=copy.deepcopy(yield_model.nuclide(self.parent.RDNLIST[r-1])['record'])
         else:
             self.rad={}
         self.apply_rad_act()
@@ -692,20 +792,26 @@ class MaterialTabWidget(QWidget):
             self.nist_cb.setCurrentIndex(0)
             self.el_cb.setCurrentIndex(0)
             self.cp_le.setText("")
-            self.mat['name']="LUXELHT"# <- use this name as a flag
-            # dummy info
-            self.mat['nElements']=1
-            self.mat['Elements']=(1)
-            self.mat['massFractions']=(1.)
-            self.mat['density']=1.
-            self.mat['thickness']=0.01
-            self.mat_dens_le.setText(str(self.mat['density']))
-            self.mat_thick_le.setText(str(self.mat['thickness']))
-            self.add_material()
-            self.mat_dens_le.setText("")
-            self.mat_thick_le.setText("")
+            self.add_table(tabulated.layer_spec("LUXELHT"))
         else:
             self.mat={}
+
+    def add_table(self,spec):
+        # tabulated layer: no thickness/density, values from the curve
+        self.mat=spec
+        if self.name=='det': self._add_detector()
+        elif self.name=='bet': self._add_filter_materials()
+
+    def open_table(self):
+        # csv with columns ev or kev, and trans (%) or fraction
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        fileName, _ = QFileDialog.getOpenFileName(self,"QFileDialog.getOpenFileName()", "","csv Files (*.csv);;All Files (*)", options=options)
+        if not fileName: return
+        try:
+            self.add_table(tabulated.layer_from(fileName,self.parent.csvd))
+        except (OSError,KeyError,ValueError) as e:
+            sys.stderr.write('Error: open_table, %s\n'%(e))
         
             
     # this was used for debug
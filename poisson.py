@@ -0,0 +1,91 @@
+import numpy as np
+
+import channels
+
+
+# counting statistics of the model spectrum for detectability studies
+# expected counts per detector channel -> n Poisson realizations (seeded
+# numpy Generator, drawn in blocks) -> line areas fitted to every realization
+# by weighted linear least squares with the model line shapes as templates
+# (weights 1/expected), which is one matrix product per block
+# lines not resolved by the detector (e.g., KB1/KB3, similar shapes) are
+# fitted as one group labelled 'KB1+KB3'
+
+
+def templates(model,ch,out=None):
+    # expected counts per channel of every line, shape (nch,nlines), and labels
+    if out is None: out=model.run()
+    labels,rows=model.line_spectra(eff=out['qe'])
+    edges=ch.edges()
+    T=np.zeros((ch.nch,len(labels)),dtype=np.float64)
+    for i,row in enumerate(rows): T[:,i]=channels.rebin(out['enes_keV'],row,edges)
+    return labels,T
+
+
+def groups(T,w,similarity=0.9):
+    # group index of every template: templates with a weighted cosine
+    # similarity above the limit to the strongest one of a group join it
+    G=np.dot(T.T,T*w[:,np.newaxis])
+    d=np.sqrt(np.maximum(np.diag(G),1e-300))
+    C=G/np.outer(d,d)
+    group=np.full(T.shape[1],-1,dtype=int)
+    ng=0
+    for i in np.argsort(-T.sum(axis=0)):
+        if group[i]>=0: continue
+        group[(C[i]>similarity) & (group<0)]=ng
+        ng+=1
+    return group
+
+
+def simulate(model,n=1000,seed=0,background=0.,ch=None,out=None,min_counts=1e-3,
+             similarity=0.9,max_bytes=256*1024**2,report=None):
+    # n: realizations, seed: generator seed (same seed, same realizations)
+    # background: flat counts per channel (fitted as one more template)
+    # ch: channels.Channels (default: one channel per grid step)
+    # min_counts: lines with fewer expected counts are in the spectrum but not fitted
+    # similarity: lines with more similar shapes are fitted as one group
+    # return: dict of per-line statistics and the expected/first realization
+    if ch is None: ch=channels.Channels.from_grid(model.uniform_grid(),model.er_step)
+    labels,T=templates(model,ch,out)
+    expected=T.sum(axis=1)+background
+    keep=T.sum(axis=0)>=min_counts
+    labels,T=[l for l,k in zip(labels,keep) if k],T[:,keep]
+    w=np.where(expected>0.,1./np.maximum(expected,1e-300),0.)
+    group=groups(T,w,similarity)
+    # no line above min_counts: empty per-line statistics, the realizations
+    # of the spectrum are still drawn
+    ng=group.max()+1 if len(group)>0 else 0
+    labels=["+".join([l for l,g in zip(labels,group) if g==k]) for k in range(ng)]
+    T=np.dot(T,np.eye(ng)[group])
+    if background>0.:
+        labels.append('background')
+        T=np.column_stack([T,np.full(ch.nch,float(background))])
+    cov=np.linalg.pinv(np.dot(T.T,T*w[:,np.newaxis]))# inverse Fisher matrix
+    truth=T.sum(axis=0)
+    proj=np.dot(T*w[:,np.newaxis],cov)*truth# areas = counts @ proj
+    areas=np.zeros((n,T.shape[1]),dtype=np.float64)
+    rng=np.random.default_rng(seed)
+    block=max(1,int(max_bytes/(8*max(ch.nch,1))))
+    example=None
+    for i in range(0,n,block):
+        if report is not None: report('realizations',i,n)
+        counts=rng.poisson(expected,size=(min(block,n-i),ch.nch))
+        if example is None: example=counts[0].copy()
+        areas[i:i+len(counts)]=np.dot(counts,proj)
+    if report is not None: report('realizations',n,n)
+    sigma=np.sqrt(np.maximum(np.diag(cov),0.))*truth
+    return {'label':labels,'counts':truth,
+            'area_mean':areas.mean(axis=0),'area_std':areas.std(axis=0),
+            'sigma':sigma,# expected error of the fitted area
+            'significance':np.where(sigma>0.,truth/np.maximum(sigma,1e-300),np.inf),
+            'detected':np.mean(areas>3.*sigma,axis=0),# fraction above 3 sigma
+            'n':n,'seed':seed,'channels':ch,'expected':expected,'example':example}
+
+
+def summary(stats):
+    lines=["%-16s %12s %12s %10s %10s %8s"%("line","counts","area_mean","area_std","signif.","det>3s")]
+    for i,label in enumerate(stats['label']):
+        lines.append("%-16s %12.4e %12.4e %10.3e %10.2f %8.3f"%(
+            label,stats['counts'][i],stats['area_mean'][i],stats['area_std'][i],
+            stats['significance'][i],stats['detected'][i]))
+    return "\n".join(lines)
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+
+# detector energy resolution models
+# fwhm(enes): enes in keV, return FWHM in eV
+
+# Fano factor and mean energy per electron-hole pair (eV)
+FANO={'Si':(0.115,3.62),
+      'Ge':(0.11,2.96),
+      'CdTe':(0.15,4.43)}
+
+
+class ConstantResolution(object):
+    def __init__(self, fwhm=8.0):
+        self.fwhm0=float(fwhm)# eV
+
+    def fwhm(self,enes):
+        return np.full(np.shape(enes),self.fwhm0,dtype=np.float64)
+
+    def __repr__(self):
+        return "const %.1f eV"%(self.fwhm0)
+
+
+# FWHM^2 = noise^2 + 8 ln2 F w E
+class FanoResolution(object):
+    def __init__(self, material='Ge', noise=0., fano=None, w=None):
+        f,ww=FANO.get(material,(0.115,3.62))
+        self.material=material
+        self.noise=float(noise)# eV FWHM, electronic noise
+        self.fano=float(fano) if fano is not None else f
+        self.w=float(w) if w is not None else ww# eV
+
+    def fwhm(self,enes):
+        enes=np.asarray(enes,dtype=np.float64)
+        return np.sqrt(self.noise**2 + 8.*np.log(2)*self.fano*self.w*enes*1e3)
+
+    def __repr__(self):
+        return "Fano %s, noise %.1f eV"%(self.material,self.noise)
+
+
+# FWHM = c0 + c1 E + c2 E^2 + ... (E in keV)
+class PolyResolution(object):
+    def __init__(self, coeffs):
+        self.coeffs=[float(c) for c in coeffs]
+
+    def fwhm(self,enes):
+        enes=np.asarray(enes,dtype=np.float64)
+        return np.maximum(np.polynomial.polynomial.polyval(enes,self.coeffs),0.)
+
+    def __repr__(self):
+        return "poly "+",".join(["%g"%c for c in self.coeffs])
+
+
+# measured FWHM(E), linearly interpolated and kept constant outside the table
+class TableResolution(object):
+    def __init__(self, enes, fwhms, name="table"):
+        order=np.argsort(enes)
+        self.enes=np.asarray(enes,dtype=np.float64)[order]# keV
+        self.fwhms=np.asarray(fwhms,dtype=np.float64)[order]# eV
+        self.name=name
+
+    @classmethod
+    def from_csv(cls, fname):
+        # columns: kev, fwhm_ev
+        df=pd.read_csv(fname)
+        return cls(df['kev'].values,df['fwhm_ev'].values,name=fname)
+
+    def fwhm(self,enes):
+        return np.interp(enes,self.enes,self.fwhms)
+
+    def __repr__(self):
+        return "table %s"%(self.name)
+
+
+def fwhm_of(res, enes):
+    # res: constant FWHM (eV) or a resolution model
+    if res is None: res=0.
+    if np.isscalar(res): return np.full(np.shape(enes),float(res),dtype=np.float64)
+    return res.fwhm(enes)
+
+
+def from_spec(spec, default_fwhm=0.):
+    # spec (csv row 'resolution_model'): ['const',fwhm] ['fano',material,noise]
+    #                                    ['poly',c0,c1,...] ['table',csv file]
+    if len(spec)==0: return ConstantResolution(default_fwhm)
+    kind=spec[0].strip().lower()
+    if kind=='const':
+        return ConstantResolution(spec[1] if len(spec)>1 else default_fwhm)
+    elif kind=='fano':
+        return FanoResolution(material=spec[1],noise=spec[2] if len(spec)>2 else default_fwhm)
+    elif kind=='poly':
+        return PolyResolution(spec[1:])
+    elif kind=='table':
+        return TableResolution.from_csv(spec[1])
+    raise ValueError("resolution: unknown model %s"%(spec[0]))
+
@@ -0,0 +1,139 @@
+import os
+import json
+import zipfile
+import numpy as np
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+import default
+
+
+# binary result files: energy grid, QE curves per layer, fluorescence per
+# component and per line, and the run configuration (json) as metadata
+# .npz (numpy, always available) or .h5 (HDF5, needs h5py)
+# arrays are written in chunks of CHUNK values and the per-line spectra one
+# line at a time, so large grids never need a full copy in memory
+CHUNK=1<<20
+FORMATS=['npz','h5']
+
+
+class NpzWriter(object):
+    # same layout as np.savez (one .npy member per array), streamed
+    def __init__(self, fname):
+        self.zf=zipfile.ZipFile(fname,'w',compression=zipfile.ZIP_STORED,allowZip64=True)
+
+    def write_rows(self,name,shape,rows):
+        # rows: iterable of shape[0] arrays (or blocks of rows) of shape[1:]
+        with self.zf.open(name+'.npy','w',force_zip64=True) as f:
+            np.lib.format.write_array_header_2_0(f,{'descr':np.lib.format.dtype_to_descr(np.dtype(np.float64)),
+                                                    'fortran_order':False,'shape':tuple(shape)})
+            for row in rows:
+                row=np.ascontiguousarray(row,dtype=np.float64).ravel()
+                for i in range(0,len(row),CHUNK): f.write(row[i:i+CHUNK].tobytes())
+
+    def write(self,name,arr):
+        arr=np.asarray(arr)
+        if arr.dtype.kind in 'US':
+            with self.zf.open(name+'.npy','w',force_zip64=True) as f:
+                np.lib.format.write_array(f,arr)
+            return
+        self.write_rows(name,arr.shape,[arr])
+
+    def close(self):
+        self.zf.close()
+
+
+class H5Writer(object):
+    def __init__(self, fname):
+        if h5py is None:
+            raise ImportError("results: h5py is required for HDF5 output")
+        self.f=h5py.File(fname,'w')
+
+    def write_rows(self,name,shape,rows):
+        dset=self.f.create_dataset(name,shape=tuple(shape),dtype=np.float64,
+                                   chunks=True if np.prod(shape)>0 else None,compression='gzip')
+        if len(shape)==1:
+            for row in rows:
+                row=np.asarray(row,dtype=np.float64)
+                for i in range(0,len(row),CHUNK): dset[i:i+CHUNK]=row[i:i+CHUNK]
+            return
+        for i,row in enumerate(rows): dset[i]=row
+
+    def write(self,name,arr):
+        arr=np.asarray(arr)
+        if arr.dtype.kind in 'US':
+            self.f.create_dataset(name,data=arr.astype(object),dtype=h5py.string_dtype())
+            return
+        self.write_rows(name,arr.shape,[arr])
+
+    def attr(self,name,val):
+        self.f.attrs[name]=val
+
+    def close(self):
+        self.f.close()
+
+
+def writer(fname):
+    ext=os.path.splitext(fname)[1].lstrip('.')
+    if ext=='npz': return NpzWriter(fname)
+    if ext in ('h5','hdf5'): return H5Writer(fname)
+    raise ValueError("results: unknown format %s"%(ext))
+
+
+def save(fname,model,out=None,lines=True,report=None,verbose=True):
+    # model: yield_model.YieldModel, out: model.run() (computed if None)
+    # lines: also write the spectrum of every line
+    # report(stage,i,n): progress, may raise yield_model.Cancelled
+    if out is None: out=model.run()
+    fname=default.file_check(fname)
+    w=writer(fname)
+    try:
+        n=len(out['enes_keV'])
+        w.write('enes_keV',out['enes_keV'])
+        for key in ['qe','trans_all','phabs_all','fluor']: w.write(key,out[key])
+        w.write_rows('trans_each',(len(out['trans_each']),n),out['trans_each'])
+        w.write('trans_labels',np.array([str(m.get('name','')) for m in model.bets]))
+        w.write_rows('phabs_each',(len(out['phabs_each']),n),out['phabs_each'])
+        w.write('phabs_labels',np.array([str(m.get('name','')) for m in model.dets]))
+        comps=out['components']
+        w.write_rows('components',(len(comps),n),[c[1] for c in comps])
+        w.write('component_labels',np.array([c[0] for c in comps]))
+        w.write('component_kinds',np.array([c[2] for c in comps]))
+        if lines:
+            labels,rows=model.line_spectra(eff=out['qe'])
+            if report is not None: rows=_reporting(rows,len(labels),report)
+            w.write_rows('lines',(len(labels),n),rows)
+            w.write('line_labels',np.array(labels,dtype=str))
+        config=json.dumps(model.config(),sort_keys=True)
+        if isinstance(w,H5Writer): w.attr('config',config)
+        else: w.write('config',np.array(config))
+    except BaseException:
+        w.close()
+        os.remove(fname)# no partial files
+        raise
+    w.close()
+    if verbose: print("%s is created."%fname)
+    return fname
+
+
+def _reporting(rows,n,report):
+    for i,row in enumerate(rows):
+        report('write lines',i,n)
+        yield row
+
+
+def load(fname):
+    # dict of arrays, 'config' as a dict
+    if os.path.splitext(fname)[1] in ('.h5','.hdf5'):
+        if h5py is None:
+            raise ImportError("results: h5py is required for HDF5 input")
+        with h5py.File(fname,'r') as f:
+            d={k:(f[k].asstr()[()] if f[k].dtype.kind=='O' else f[k][()]) for k in f.keys()}
+            d['config']=json.loads(f.attrs['config'])
+        return d
+    with np.load(fname) as f:
+        d={k:f[k] for k in f.files}
+    d['config']=json.loads(str(d['config']))
+    return d
@@ -0,0 +1,133 @@
+import numpy as np
+import scipy.special
+
+
+# secondary fluorescence (matrix enhancement) in one homogeneous layer
+# line j is emitted at mass depth z with Q_j w_j exp(-mu_0 z/sin(alpha)) per
+# unit mass depth, isotropically; along a direction with cosine u to the
+# normal it is absorbed after the mass path s and excites line i with
+# w_i CS_FluorLine_Kissel(i, E_j) exp(-mu_j s) ds, and line i leaves the layer
+# with exp(-mu_i z'/sin(beta)) from the depth z' = z +- s u
+# the path s is integrated analytically up to the layer surface, the depth z
+# (Gauss-Legendre on log-spaced panels, down to 1e-6 of the relevant depth)
+# and u (Gauss-Legendre, du/2 per hemisphere) numerically
+# across layers (line j from layer a absorbed in layer b) the angle integral
+# is analytic, int_0^1 du/(2u) exp(-T/u) = E1(T)/2 with T the optical depth
+# of line j between the two depths, and both depths are integrated
+# numerically (panels log-spaced towards both faces of each layer)
+NPANEL=12
+NPER=8
+NU=24
+NPANEL_X=6# across layers (per half layer)
+NPER_X=6
+
+
+def _gauss(n,a,b):
+    x,w=np.polynomial.legendre.leggauss(n)
+    return 0.5*(b-a)*x+0.5*(b+a),0.5*(b-a)*w
+
+
+def _depth_nodes(npanel,nper):
+    # nodes and weights on [0,1], panels 0,1e-6,...,1 (log-spaced)
+    edges=np.concatenate([[0.],np.logspace(-6,0,npanel)])
+    nodes=[_gauss(nper,a,b) for a,b in zip(edges[:-1],edges[1:])]
+    return np.concatenate([n[0] for n in nodes]),np.concatenate([n[1] for n in nodes])
+
+
+def _layer_nodes(m,npanel,nper):
+    # nodes and weights on [0,m], dense towards both faces
+    t,w=_depth_nodes(npanel,nper)
+    return (np.concatenate([0.5*m*t,m-0.5*m*t[::-1]]),
+            np.concatenate([0.5*m*w,0.5*m*w[::-1]]))
+
+
+def geometry(c0,mu_j,c_i,m,npanel=NPANEL,nper=NPER,nu=NU,max_size=1<<22):
+    # depth and angle integral for every (line i, line j) pair and beam energy
+    # c0: mu_0/sin(alpha) of every beam energy, mu_j: matrix cross section at
+    # E_j, c_i: mu_i/sin(beta) (cm2/g) of every pair, m: layer mass thickness (g/cm2)
+    # the depth nodes are shared by all pairs and beam energies, so the beam
+    # energies enter as one matrix product with exp(-c0 z)
+    # return: G (pair x beam energy), times w_i F_ij Q_j w_j gives the yield
+    c0=np.atleast_1d(np.asarray(c0,dtype=np.float64))
+    mu_j=np.atleast_1d(np.asarray(mu_j,dtype=np.float64))
+    c_i=np.atleast_1d(np.asarray(c_i,dtype=np.float64))
+    # beyond a few attenuation lengths of line i (or of the path of line j)
+    # nothing reaches the surface; shorter scales are resolved by the panels
+    decay=np.min(np.minimum(c_i,mu_j)) if len(c_i)>0 else 0.
+    depth=min(m,40./decay) if decay>0. else m
+    t,wt=_depth_nodes(npanel,nper)
+    z=depth*t
+    u,wu=_gauss(nu,0.,1.)
+    Z,U=z[np.newaxis,:,np.newaxis],u[np.newaxis,np.newaxis,:]
+    inner=np.zeros((len(c_i),len(z)),dtype=np.float64)
+    step=max(1,int(max_size/(len(z)*nu)))
+    for k in range(0,len(c_i),step):
+        s=slice(k,k+step)
+        mj=mu_j[s,np.newaxis,np.newaxis]
+        ci=c_i[s,np.newaxis,np.newaxis]
+        exit_z=np.exp(-ci*Z)
+        # deeper: s up to (m-z)/u
+        kd=mj+ci*U
+        down=exit_z*(-np.expm1(-kd*(m-Z)/U))/kd
+        # shallower: s up to z/u (k_u<0: line i gains more than the path loses)
+        ku=mj-ci*U
+        flat=np.abs(ku)*Z<=1e-8*U
+        up=np.where(flat,exit_z*Z/U,(exit_z-np.exp(-mj*Z/U))/np.where(flat,1.,ku))
+        inner[s]=np.dot(down+up,0.5*wu)
+    return np.dot(inner*(wt*depth)[np.newaxis,:],np.exp(-np.outer(z,c0)))
+
+
+def cross_geometry(c0,j,mu_a,mu_b,between,c_i,m_a,m_b,below,npanel=NPANEL_X,nper=NPER_X):
+    # depth integrals for line j emitted in layer a and absorbed in layer b
+    # c0: mu_0/sin(alpha) in layer a (beam energies), j: exciting line of
+    # every pair, mu_a/mu_b: cross section of a/b at E_j (per line),
+    # between: optical depth of the layers between a and b at E_j (per line),
+    # c_i: mu_i/sin(beta) in layer b (pairs), m_a/m_b: mass thicknesses,
+    # below: b is below a; depths from the top of each layer
+    # return: G (pair x beam energy) as geometry
+    za,wa=_layer_nodes(m_a,npanel,nper)
+    zb,wb=_layer_nodes(m_b,npanel,nper)
+    da,db=(m_a-za,zb) if below else (za,m_b-zb)# distances to the facing sides
+    exit_b=np.exp(-np.outer(np.asarray(c_i,dtype=np.float64),zb))*wb[np.newaxis,:]
+    inner=np.zeros((len(j),len(za)),dtype=np.float64)
+    for k in np.unique(j):
+        T=mu_a[k]*da[:,np.newaxis]+between[k]+mu_b[k]*db[np.newaxis,:]
+        K=0.5*scipy.special.exp1(np.maximum(T,1e-300))
+        inner[j==k]=np.dot(exit_b[j==k],K.T)
+    return np.dot(inner*wa[np.newaxis,:],np.exp(-np.outer(za,np.asarray(c0,dtype=np.float64))))
+
+
+def enhancement(Q,w,F,mu_0,mu_lines,m,sin_a,sin_b):
+    # secondary yield of every (line, beam energy) in a layer (same
+    # normalization as the primary Q w m A of yield_model.stack_yield)
+    # Q: CS_FluorLine_Kissel (line x beam energy), w: mass fraction of the
+    # element of each line, F: (line i, line j) CS_FluorLine_Kissel of line i
+    # at the energy of line j, mu_0: matrix cross section at the beam energies,
+    # mu_lines: at the line energies
+    # only pairs where line j excites line i are integrated
+    Q=np.atleast_2d(np.asarray(Q,dtype=np.float64))
+    coef=w[:,np.newaxis]*F*w[np.newaxis,:]
+    coef[:,np.max(Q,axis=1)<=0.]=0.
+    ii,jj=np.nonzero(coef>0.)
+    y=np.zeros(Q.shape,dtype=np.float64)
+    if len(ii)==0 or m<=0.: return y
+    G=geometry(np.asarray(mu_0)/sin_a,mu_lines[jj],mu_lines[ii]/sin_b,m)
+    np.add.at(y,ii,coef[ii,jj][:,np.newaxis]*Q[jj,:]*G)
+    return y
+
+
+def cross_enhancement(Q,w_a,w_b,F,mu_0a,mu_a,mu_b,between,m_a,m_b,below,sin_a,sin_b):
+    # secondary yield in layer b excited by the lines of layer a (same
+    # normalization as enhancement; the layers above a and b are applied by
+    # the caller), w_a/w_b: mass fraction of the element of each line in a/b,
+    # mu_0a: cross section of a at the beam energies, mu_a/mu_b: of a/b at
+    # the line energies, between: optical depth between the layers
+    Q=np.atleast_2d(np.asarray(Q,dtype=np.float64))
+    coef=w_b[:,np.newaxis]*F*w_a[np.newaxis,:]
+    coef[:,np.max(Q,axis=1)<=0.]=0.
+    ii,jj=np.nonzero(coef>0.)
+    y=np.zeros(Q.shape,dtype=np.float64)
+    if len(ii)==0 or m_a<=0. or m_b<=0.: return y
+    G=cross_geometry(np.asarray(mu_0a)/sin_a,jj,mu_a,mu_b,between,mu_b[ii]/sin_b,m_a,m_b,below)
+    np.add.at(y,ii,coef[ii,jj][:,np.newaxis]*Q[jj,:]*G)
+    return y
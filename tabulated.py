@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+# measured transmission/efficiency curves (filter windows, thermal shields,
+# detector QE) loaded once and used as filter or detector layers
+# a layer from a curve is a dict with 'table' (registered name: the built-in
+# name, or the absolute path of a user csv so that equal basenames do not
+# collide) and 'name' (label), see layer_spec
+# values: fraction transmitted for a filter, fraction absorbed (QE) for a detector
+
+class Curve(object):
+    def __init__(self, name, enes, vals):
+        order=np.argsort(enes)
+        self.name=name
+        self.enes=np.asarray(enes,dtype=np.float64)[order]# keV
+        self.vals=np.asarray(vals,dtype=np.float64)[order]# 0-1
+
+    @classmethod
+    def from_csv(cls, fname, name=None):
+        # columns: ev or kev, and trans (percent, as LUXEL_filter_HT_large.csv)
+        #          or fraction (0-1)
+        df=pd.read_csv(fname)
+        enes=df['kev'].values if 'kev' in df.columns else df['ev'].values*1e-3
+        vals=df['fraction'].values if 'fraction' in df.columns else df['trans'].values/100.
+        if name is None: name=os.path.splitext(os.path.basename(fname))[0]
+        return cls(name,enes,vals)
+
+    def __call__(self,enes):
+        # linear interpolation, constant outside the table
+        return np.interp(enes,self.enes,self.vals)
+
+
+# curves shipped in the csv directory
+BUILTIN={'LUXELHT':'LUXEL_filter_HT_large.csv'}
+TABLES={}
+
+
+def register(curve,key=None):
+    # key: registered name (default: the curve name)
+    TABLES[key if key is not None else curve.name]=curve
+    return curve
+
+
+def register_csv(fname,name=None,key=None):
+    return register(Curve.from_csv(fname,name),key)
+
+
+def get(name,csvd="./csv/"):
+    if name not in TABLES:
+        if name in BUILTIN:
+            register_csv(os.path.join(csvd,BUILTIN[name]),name)
+        elif os.path.isabs(name) and os.path.exists(name):
+            register_csv(name,key=name)# user csv of a stored configuration
+        else:
+            raise ValueError("tabulated: unknown curve %s"%(name))
+    return TABLES[name]
+
+
+def layer_spec(name,label=None):
+    # filter/detector layer from a registered (or built-in) curve
+    return {'name':label if label is not None else name,'table':name,'thickness':0.,'density':0.}
+
+
+def layer_from(entry,csvd="./csv/"):
+    # entry: built-in/registered name or a csv file (relative to . or csvd),
+    # registered under its absolute path (read again on every call)
+    if entry in BUILTIN: return layer_spec(entry)
+    fname=os.path.abspath(entry if os.path.exists(entry) else os.path.join(csvd,entry))
+    if entry in TABLES and not os.path.exists(fname): return layer_spec(entry,TABLES[entry].name)
+    return layer_spec(fname,register_csv(fname,key=fname).name)
+
+
+def table_name(mat):
+    # curve of a layer, None for a material ('LUXELHT' name: older GUI layers)
+    if 'table' in mat: return mat['table']
+    if mat.get('name')=="LUXELHT": return "LUXELHT"
+    return None
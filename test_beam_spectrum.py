@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+import beam_spectrum
+
+
+def _band(enes,weights,lo,hi):
+    return weights[(enes>lo)&(enes<hi)].sum()
+
+
+def _peak(enes,weights,ene,side):
+    # bin content over the continuum read off 'side' bins away
+    i=np.argmin(abs(enes-ene))
+    return weights[i]-weights[i+side]
+
+
+@pytest.mark.parametrize('kV,window_um',[(30.,500.),(50.,127.)])
+def test_mo_k_over_l(kV,window_um):
+    enes,weights=beam_spectrum.tube('Mo',kV,window_um=window_um)
+    assert _band(enes,weights,17.3,17.6)>_band(enes,weights,2.,3.)
+
+
+def test_mo_l_to_k_ebel(monkeypatch):
+    # behind 127 um Be at 30 kV the L lines of Mo are stronger than K alpha:
+    # Ebel's (1999) closed form gives La/Ka=1.63 without Coster-Kronig
+    monkeypatch.setattr(beam_spectrum,'COSTER_KRONIG',[])
+    enes,weights=beam_spectrum.tube('Mo',30.)
+    la=_peak(enes,weights,2.2915,-2)
+    ka=_peak(enes,weights,17.479,3)+_peak(enes,weights,17.374,-2)
+    assert la/ka==pytest.approx(1.63,rel=0.1)
@@ -0,0 +1,174 @@
+import numpy as np
+
+import xraylib as xrl
+try:
+    import xraylib_np as xrl_np
+except ImportError:
+    xrl_np = None
+
+
+# cross section types handled by the engine (xraylib CS_* names)
+CS_TYPES=['Total','Photo','Rayl','Compt']
+
+
+def decompose(mat):
+    # mat: element symbol, compound formula, NIST compound name,
+    #      or a dict from CompoundParser / GetCompoundDataNISTBy*
+    # return: (atomic numbers, mass fractions) as numpy arrays
+    if isinstance(mat,str):
+        try:
+            mat=xrl.CompoundParser(mat)
+        except ValueError:
+            mat=xrl.GetCompoundDataNISTByName(mat)
+    zs=np.atleast_1d(np.array(mat['Elements'],dtype=np.int64))
+    ws=np.atleast_1d(np.array(mat['massFractions'],dtype=np.float64))
+    return zs,ws
+
+
+def cs_elements(zs,enes,cstype='Total'):
+    # mass attenuation (cm2/g) for each element, shape (len(zs),len(enes))
+    zs=np.atleast_1d(np.asarray(zs,dtype=np.int64))
+    enes=np.ascontiguousarray(np.atleast_1d(enes),dtype=np.float64)
+    if cstype not in CS_TYPES:
+        raise ValueError("cs_elements: unknown cross section type %s"%(cstype))
+    if xrl_np is not None:
+        return xrl_np.__getattribute__('CS_%s'%(cstype))(zs,enes)
+    # fallback: one xraylib call per element and energy
+    func=xrl.__getattribute__('CS_%s'%(cstype))
+    out=np.zeros((len(zs),len(enes)),dtype=np.float64)
+    for i,z in enumerate(zs):
+        for j,E in enumerate(enes):
+            try:
+                out[i,j]=func(int(z),E)
+            except ValueError:
+                out[i,j]=0.
+    return out
+
+
+def cs_material(mat,enes,cstype='Total'):
+    # mass attenuation (cm2/g) of a material on the energy array (keV)
+    zs,ws=decompose(mat)
+    return np.dot(ws,cs_elements(zs,enes,cstype))
+
+
+def cs_material_all(mat,enes,cstypes=CS_TYPES):
+    # all requested cross section types in one pass over the elements
+    zs,ws=decompose(mat)
+    return {cstype:np.dot(ws,cs_elements(zs,enes,cstype)) for cstype in cstypes}
+
+
+def fluorline_kissel(zs,lines,enes):
+    # CS_FluorLine_Kissel (cm2/g) for every element, line and excitation energy
+    # shape (len(zs),len(lines),len(enes)), zero where the line is not excited
+    zs=np.atleast_1d(np.asarray(zs,dtype=np.int64))
+    lines=np.atleast_1d(np.asarray(lines,dtype=np.int64))
+    enes=np.ascontiguousarray(np.atleast_1d(enes),dtype=np.float64)
+    if xrl_np is not None:
+        return xrl_np.CS_FluorLine_Kissel(zs,lines,enes)
+    out=np.zeros((len(zs),len(lines),len(enes)),dtype=np.float64)
+    for i,z in enumerate(zs):
+        for j,line in enumerate(lines):
+            for k,E in enumerate(enes):
+                try:
+                    out[i,j,k]=xrl.CS_FluorLine_Kissel(int(z),int(line),E)
+                except ValueError:
+                    out[i,j,k]=0.
+    return out
+
+
+# absorption edges considered for grids and interpolation (K, L1-3, M1-5)
+EDGE_SHELLS=[xrl.K_SHELL,xrl.L1_SHELL,xrl.L2_SHELL,xrl.L3_SHELL,
+             xrl.M1_SHELL,xrl.M2_SHELL,xrl.M3_SHELL,xrl.M4_SHELL,xrl.M5_SHELL]
+
+
+def edge_energies(zs,low=0.,high=np.inf):
+    # absorption edge energies (keV) of the elements within [low,high], sorted
+    edges=[]
+    for z in np.atleast_1d(zs):
+        for shell in EDGE_SHELLS:
+            try:
+                e=xrl.EdgeEnergy(int(z),shell)
+            except ValueError:
+                continue
+            if e>0. and low<=e<=high: edges.append(e)
+    return np.unique(edges)
+
+
+# log-log interpolation of the elemental cross sections
+# the cross sections are smooth in log-log between absorption edges, so a table
+# of nodes per element (independent of the energy grid) replaces the direct
+# xraylib evaluation on fine grids within a bounded relative error
+LOGLOG_RANGE=(0.1,800.)# keV, range of the xraylib tables
+_loglog_tables={}
+
+
+def _loglog_eval(enes,nodes,vals):
+    return np.exp(np.interp(np.log(enes),np.log(nodes),np.log(vals)))
+
+
+def loglog_table(z,cstype='Total',rtol=1e-4,npd=50,maxiter=60):
+    # nodes (keV) and cross sections (cm2/g) of one element
+    # start: npd points per decade and the edges (EdgeEnergy, K to N7 shells),
+    # then intervals where any of 3 interior test points (equally spaced in
+    # log E) deviates by more than rtol/2 from xraylib are split (margin for the
+    # knots of the xraylib splines between test points); the jumps of the tabulated data (up to ~20 eV off
+    # EdgeEnergy) end up bracketed by two nodes 1e-9 apart (relative)
+    key=(int(z),cstype,rtol,npd)
+    if key in _loglog_tables: return _loglog_tables[key]
+    low,high=LOGLOG_RANGE
+    nodes=[np.exp(np.linspace(np.log(low),np.log(high),int(npd*np.log10(high/low))+1))]
+    for shell in range(xrl.K_SHELL,xrl.N7_SHELL+1):
+        try:
+            e=xrl.EdgeEnergy(int(z),shell)
+        except ValueError:
+            continue
+        if low<e<high: nodes.append(np.array([e]))
+    nodes=np.unique(np.concatenate(nodes))
+    vals=np.maximum(cs_elements([z],nodes,cstype)[0],1e-300)
+    fracs=np.array([0.25,0.5,0.75])
+    for it in range(maxiter):
+        wide=nodes[1:]/nodes[:-1]-1.>1e-9
+        if not np.any(wide): break
+        lo,hi=np.log(nodes[:-1][wide]),np.log(nodes[1:][wide])
+        mids=np.exp(lo[:,np.newaxis]+(hi-lo)[:,np.newaxis]*fracs).ravel()
+        fmid=np.maximum(cs_elements([z],mids,cstype)[0],1e-300)
+        err=np.abs(_loglog_eval(mids,nodes,vals)/fmid-1.).reshape(-1,len(fracs))
+        bad=np.repeat(np.any(err>0.5*rtol,axis=1),len(fracs))
+        if not np.any(bad): break
+        nodes=np.concatenate([nodes,mids[bad]])
+        vals=np.concatenate([vals,fmid[bad]])
+        order=np.argsort(nodes)
+        nodes,vals=nodes[order],vals[order]
+    _loglog_tables[key]=(nodes,vals)
+    return nodes,vals
+
+
+def cs_elements_loglog(zs,enes,cstype='Total',rtol=1e-4):
+    # same as cs_elements, interpolated from the tables (direct evaluation
+    # outside LOGLOG_RANGE)
+    zs=np.atleast_1d(np.asarray(zs,dtype=np.int64))
+    enes=np.ascontiguousarray(np.atleast_1d(enes),dtype=np.float64)
+    if cstype not in CS_TYPES:
+        raise ValueError("cs_elements_loglog: unknown cross section type %s"%(cstype))
+    out=np.zeros((len(zs),len(enes)),dtype=np.float64)
+    inside=(enes>=LOGLOG_RANGE[0]) & (enes<=LOGLOG_RANGE[1])
+    for i,z in enumerate(zs):
+        nodes,vals=loglog_table(z,cstype,rtol)
+        out[i,inside]=_loglog_eval(enes[inside],nodes,vals)
+    if not np.all(inside):
+        out[:,~inside]=cs_elements(zs,enes[~inside],cstype)
+    return out
+
+
+def cs_material_loglog(mat,enes,cstype='Total',rtol=1e-4):
+    zs,ws=decompose(mat)
+    return np.dot(ws,cs_elements_loglog(zs,enes,cstype,rtol))
+
+
+def loglog_check(mat,enes,cstype='Total',rtol=1e-4):
+    # accuracy check of the interpolation against direct xraylib evaluation
+    # return: max relative error on the energy array
+    direct=cs_material(mat,enes,cstype)
+    interp=cs_material_loglog(mat,enes,cstype,rtol)
+    ok=direct>0.
+    return np.max(np.abs(interp[ok]/direct[ok]-1.)) if np.any(ok) else 0.
@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import default
+import atten_cache
+import yield_model
+import results
+import catalog
+import channels
+import poisson
+
+
+# evaluate one scenario csv and write qe/fluor into outdir
+def run_scenario(fname,outdir,er_low,er_high,er_step,cachedir,csvd,scan=None,
+                 profile_window=50.,profile_tail='lorentz',grid_mode='uniform',atten_rtol=None,
+                 line_threshold=None,fmt='txt',catalogdb=None,adc=None,
+                 nreal=None,seed=0,background=0.,secondary=False):
+    t0=time.time()
+    dic=default.read_default_csv(fname)
+    cache=atten_cache.AttenuationCache(cachedir=cachedir) if cachedir else None
+    model=yield_model.model_from_default(dic,er_low=er_low,er_high=er_high,er_step=er_step,
+                                         csvd=csvd,cache=cache,
+                                         profile_window=profile_window,profile_tail=profile_tail,
+                                         grid_mode=grid_mode,atten_rtol=atten_rtol,
+                                         all_lines=line_threshold is not None,
+                                         line_threshold=line_threshold if line_threshold is not None else 1e-4,
+                                         secondary=secondary)
+    cat=catalog.Catalog(catalogdb) if catalogdb else None
+    if cat is not None:
+        # stored result of an identical configuration (computed and stored if new)
+        out=cat.run(model)
+    else:
+        out=model.run()
+    if atten_rtol is not None:
+        print("%s: attenuation interpolation max rel. error %.2e"%(fname,model.atten_check()))
+    # outputs always on the requested uniform grid
+    enes=model.uniform_grid()
+    base=os.path.splitext(os.path.basename(fname))[0]
+    os.makedirs(outdir, exist_ok=True)
+    if fmt=='txt':
+        default.save_numpy_arrays(enes,model.to_uniform(out['qe']),'%s/%s_qe.txt'%(outdir,base))
+        default.save_numpy_arrays(enes,model.to_uniform(out['fluor']),'%s/%s_fluor.txt'%(outdir,base))
+    elif cat is not None and fmt=='npz':
+        cat.export(model,default.file_check('%s/%s.npz'%(outdir,base)))
+    else:
+        # binary: model grid as computed, every curve, component and line
+        results.save('%s/%s.%s'%(outdir,base,fmt),model,out if cat is None else None)
+    # detector channel histogram (scenario row adc_channels or --channels)
+    if adc is None and len(dic.get('adc_channels',[]))>0: adc=dic['adc_channels']
+    if adc is not None:
+        channels.save('%s/%s_channels'%(outdir,base),channels.Channels.from_spec(adc),out['enes_keV'],out['fluor'],
+                      extra={'gqe':(out['enes_keV'],out['qe'])})
+    # counting statistics of nreal Poisson realizations
+    if nreal is not None:
+        st=poisson.simulate(model,n=nreal,seed=seed,background=background,
+                            ch=channels.Channels.from_spec(adc) if adc is not None else None,
+                            out=out)
+        default.save_table({k:st[k] for k in ['label','counts','area_mean','area_std','sigma','significance','detected']},
+                           '%s/%s_poisson.txt'%(outdir,base))
+    if scan is not None and model.has_target():
+        sc=model.beam_scan(np.arange(scan[0],scan[1]+scan[2]/2.,scan[2]),
+                           linetypes=model.linedb.linetypes if model.all_lines else None)
+        labels=["%s_%s"%(el,lt) for el,lt in zip(sc['el'],sc['sgblinetype'])]
+        default.save_scan(sc['beamene'],sc['yield'],labels,'%s/%s_scan.txt'%(outdir,base))
+    return fname,time.time()-t0
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description="xray yield simulation, batch mode over scenario csv files")
+    parser.add_argument('scenarios',nargs='+',help="scenario csv files (same format as csv/default_*.csv)")
+    parser.add_argument('-o','--outdir',default='./output',help="output directory (default: ./output)")
+    parser.add_argument('--low',type=float,default=0.1,help="energy range low (keV)")
+    parser.add_argument('--high',type=float,default=20.,help="energy range high (keV)")
+    parser.add_argument('--step',type=float,default=0.001,help="energy step (keV)")
+    parser.add_argument('--scan',type=float,nargs=3,metavar=('LOW','HIGH','STEP'),
+                        help="also scan the incident energy (keV) and write line yields vs beam energy")
+    parser.add_argument('--window',type=float,default=50.,
+                        help="line profiles are evaluated within +-WINDOW x FWHM (<=0: whole grid)")
+    parser.add_argument('--tail',choices=['lorentz','cut'],default='lorentz',
+                        help="profile outside the window: Lorentzian asymptote or cut")
+    parser.add_argument('--adaptive',action='store_true',
+                        help="compute on a non-uniform grid dense near lines and edges (outputs are resampled)")
+    parser.add_argument('--atten-rtol',type=float,default=None,
+                        help="interpolate cross sections in log-log between edges within this relative error (default: xraylib at every energy)")
+    parser.add_argument('--all-lines',type=float,default=None,metavar='THRESHOLD',
+                        help="use every IUPAC line (incl. M lines), pruning lines weaker than THRESHOLD x the strongest one (e.g. 1e-4)")
+    parser.add_argument('--secondary',action='store_true',
+                        help="include secondary fluorescence (target lines excited by other target lines, within and across layers)")
+    parser.add_argument('--format',choices=['txt']+results.FORMATS,default='txt',
+                        help="txt: qe/fluor ascii files, npz/h5: one binary file with the grid, per-layer curves, components, lines and the configuration")
+    parser.add_argument('--channels',nargs='+',default=None,metavar='N OFFSET GAIN',
+                        help="also write the spectrum binned on N detector channels, E(ch)=OFFSET+GAIN*ch[+C2*ch^2...] keV (<scenario>_channels.root, or .npz without PyROOT)")
+    parser.add_argument('--poisson',type=int,default=None,metavar='N',
+                        help="also draw N Poisson realizations and write per-line counting statistics (<scenario>_poisson.txt)")
+    parser.add_argument('--seed',type=int,default=0,help="random seed of --poisson")
+    parser.add_argument('--background',type=float,default=0.,help="flat background (counts/channel) of --poisson")
+    parser.add_argument('--catalog',default='',metavar='DB',
+                        help="result catalog (e.g. ./output/catalog.sqlite): scenarios already computed with the same configuration are not recomputed")
+    parser.add_argument('-j','--jobs',type=int,default=os.cpu_count(),help="number of worker processes")
+    parser.add_argument('--cachedir',default=atten_cache.default_cachedir(),
+                        help="attenuation cache directory ('' to disable, default: $XYS_CACHEDIR or ~/.cache/xys)")
+    parser.add_argument('--csvd',default='./csv/',help="directory of IUPAC_macro.csv etc.")
+    args=parser.parse_args(argv)
+
+    nfail=0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures={pool.submit(run_scenario,f,args.outdir,args.low,args.high,args.step,
+                             args.cachedir,args.csvd,args.scan,
+                             args.window if args.window>0 else None,args.tail,
+                             'adaptive' if args.adaptive else 'uniform',args.atten_rtol,
+                             args.all_lines,args.format,args.catalog,args.channels,
+                             args.poisson,args.seed,args.background,args.secondary):f for f in args.scenarios}
+        for fut in as_completed(futures):
+            try:
+                fname,dt=fut.result()
+                print("%s done (%.2f sec)"%(fname,dt))
+            except Exception as e:
+                nfail+=1
+                sys.stderr.write('Error: %s, %s\n'%(futures[fut],e))
+    print("%d scenarios, %d failed"%(len(args.scenarios),nfail))
+    return 1 if nfail>0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
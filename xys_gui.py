@@ -1,11 +1,11 @@
 import signal
 import os
+import copy
+import argparse
 import time
 import sys
 import numpy as np
 import pandas as pd
-import scipy.special
-from scipy.interpolate import interp1d
 
 
 from PyQt5.QtCore import *
@@ -26,14 +26,51 @@ import xraylib as xrl
 import default
 import material
 import line_wrap
-from line_wrap import voigt
-
-sigma_from_fwhm=2.*np.sqrt(2.*np.log(2))
-
+import atten_cache
+import yield_model
+import resolution
+import egrid
+import tabulated
+import results
+import catalog
+import channels
+import poisson
+import beam_spectrum
+
+
+# runs the calculation of Plot (or the file output of Save) off the GUI thread
+# job(report) is called on the worker thread; report(stage,i,n) posts the
+# progress and raises yield_model.Cancelled once cancel() has been requested
+class Worker(QThread):
+    progress=pyqtSignal(str,int,int)
+    done=pyqtSignal(object)
+    failed=pyqtSignal(str)
+
+    def __init__(self, job, parent=None):
+        super(Worker, self).__init__(parent)
+        self.job=job
+        self.cancelled=False
+
+    def cancel(self):
+        self.cancelled=True
+
+    def report(self,stage,i,n):
+        if self.cancelled: raise yield_model.Cancelled(stage)
+        self.progress.emit(stage,i,n)
+
+    def run(self):
+        try:
+            out=self.job(self.report)
+        except yield_model.Cancelled:
+            return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        if not self.cancelled: self.done.emit(out)
 
 
 class ApplicationWindow(QMainWindow):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, csvd="./csv/", cachedir=None, debug=False):
         super(ApplicationWindow, self).__init__(parent)
         
         QMainWindow.__init__(self)
@@ -49,33 +86,37 @@ class ApplicationWindow(QMainWindow):
         self.enes_keV=np.arange(self.er_low,self.er_high+self.er_low+self.er_step,self.er_step)
         self.qeout=np.zeros_like(self.enes_keV)# for output
         self.flout=np.zeros_like(self.enes_keV)# for output
-        # IUPAC macro
-        self.LINES=['KL3','KL2','KM3','KM2',
-                    'L3M5','L3M4','L2M4','L3N5',
-                    'L1M3','L1M2','L2N4','L3M1']
-        # Siegbahn
-        self.SGBLINES=['KA1','KA2','KB1','KB3',
-                       'LA1','LA2','LB1','LB2',
-                       'LB3','LB4','LG1','LL']
+        self.enes_out=self.enes_keV# uniform grid for output
+        self.fl_artists=[]# (label, Line2D) of the fluorescence plot
+        self.plot_worker=None# running Plot calculation
+        self.table_worker=None# running line table update
+        self.workers=[]# all running workers (kept alive until finished)
 
         # radionuclide list
         self.RDNLIST=list(xrl.GetRadioNuclideDataList())
         #['55Fe','57Co','109Cd','125I','137Cs',
         #'133Ba','153Gd','238Pu','241Am','244Cm']
         # half life
-        self.RDNHL=[1006.70,272.11,463.26,59.49,11018.3,
-                    3854.7,239.472,32031.74,157857.678,6610.52]# days
+        self.RDNHL=yield_model.RDNHL# days
 
         # universal parameters
         self.rad_duration=3600.# sec
         self.beam_duration=7200.# sec
         self.detector_resolution=8.0# eV
         self.detector_solidangle=1.0
+        self.RESOL_MODELS=["Constant","Fano (Si)","Fano (Ge)","Fano (CdTe)","From csv"]
+        self.resolution_from_csv=None# resolution model given in a csv file
+        self.tail_tau=0.# eV
+        self.tail_frac=0.
+        self.line_threshold=1e-4# relative to the strongest target line
         
-        self.csvd="./csv/"
-        IUPACdf=pd.read_csv(self.csvd+"IUPAC_macro.csv")
-        self.IUPACmac=IUPACdf['IUPAC_macro'].values
-        self.allLINES=[xrl.__getattribute__(mac) for mac in self.IUPACmac] 
+        self.csvd=csvd
+        # attenuation arrays are kept on disk between sessions
+        # (cachedir None: atten_cache.default_cachedir())
+        self.atten_cache=atten_cache.AttenuationCache(cachedir=cachedir)
+        self.debug=debug# print the cache reports after every Plot
+        # grid, layer curves and line tables shared by the redraws
+        self.compute_ctx=yield_model.ComputeContext()
         
         # ---- layout ----
         # main widget
@@ -137,6 +178,7 @@ class ApplicationWindow(QMainWindow):
         qtab=QTabWidget()
         self.bem={}
         self.tgt={}
+        self.tgts=[]# target layers, beam side first
         self.det={}
         self.bet={}
         self.rad={}
@@ -165,6 +207,41 @@ class ApplicationWindow(QMainWindow):
         plotButton.clicked.connect(self._plot_trans_fluor)
         saveButton = QPushButton("Save")
         saveButton.clicked.connect(self._save_trans_fluor)
+        # data format of Save: ascii qe/fluor or a binary file with every curve
+        self.save_fmt_cb = QComboBox()
+        self.save_fmt_cb.addItems(["txt"]+[f for f in results.FORMATS if f!='h5' or results.h5py is not None])
+        # detector channels of the histogram output (empty: one bin per grid step)
+        self.channels_le = QLineEdit()
+        self.channels_le.setPlaceholderText("ADC: nch,offset,keV/ch[,c2..]")
+        # counting statistics: Poisson realizations of the plotted spectrum
+        poissonButton = QPushButton("Simulate")
+        poissonButton.clicked.connect(self._simulate_poisson)
+        self.poisson_n_le = QLineEdit()
+        self.poisson_n_le.setValidator(QIntValidator(1,1000000))
+        self.poisson_n_le.setText("1000")
+        self.poisson_seed_le = QLineEdit()
+        self.poisson_seed_le.setValidator(QIntValidator(0,2147483647))
+        self.poisson_seed_le.setText("0")
+        self.poisson_bkg_le = QLineEdit()
+        self.poisson_bkg_le.setValidator(QDoubleValidator(0.,1e11,999))
+        self.poisson_bkg_le.setText("0")
+        poissonbox=QHBoxLayout()
+        poissonbox.addWidget(poissonButton)
+        poissonbox.addWidget(QLabel("N:"))
+        poissonbox.addWidget(self.poisson_n_le)
+        poissonbox.addWidget(QLabel("seed:"))
+        poissonbox.addWidget(self.poisson_seed_le)
+        poissonbox.addWidget(QLabel("bkg/ch:"))
+        poissonbox.addWidget(self.poisson_bkg_le)
+        # progress of the background calculation
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("idle")
+        self.progress_bar.setValue(0)
+        cancelButton = QPushButton("Cancel")
+        cancelButton.clicked.connect(self._cancel_workers)
+        progbox=QHBoxLayout()
+        progbox.addWidget(self.progress_bar)
+        progbox.addWidget(cancelButton)
         #plotButton = QPushButton("Plot transmission")
         #plotButton.clicked.connect(self._update_trans_cv)
         #fluorButton = QPushButton("Plot flurorescence")
@@ -196,11 +273,28 @@ class ApplicationWindow(QMainWindow):
         self.detector_resolution_le.setValidator(QDoubleValidator(0.,1e5,999))
         self.detector_resolution_le.returnPressed.connect(self.apply_detector_resolution)
         self.detector_resolution_le.setText(str(self.detector_resolution))
+        # energy dependence of the resolution
+        self.resol_cb = QComboBox()
+        self.resol_cb.addItems(self.RESOL_MODELS)
         # detector solidangle
         self.detector_solidangle_le = QLineEdit()
         self.detector_solidangle_le.setValidator(QDoubleValidator(0.,1.,999))
         self.detector_solidangle_le.returnPressed.connect(self.apply_detector_solidangle)
         self.detector_solidangle_le.setText(str(self.detector_solidangle))
+        # detector response low-energy tail (FFT convolution)
+        self.tail_tau_le = QLineEdit()
+        self.tail_tau_le.setValidator(QDoubleValidator(0.,1e5,999))
+        self.tail_tau_le.returnPressed.connect(self.apply_tail)
+        self.tail_tau_le.setText("10.")
+        self.tail_frac_le = QLineEdit()
+        self.tail_frac_le.setValidator(QDoubleValidator(0.,1.,999))
+        self.tail_frac_le.returnPressed.connect(self.apply_tail)
+        self.tail_frac_le.setText("0.1")
+        tailbox=QHBoxLayout()
+        tailbox.addWidget(QLabel("tau (eV):"))
+        tailbox.addWidget(self.tail_tau_le)
+        tailbox.addWidget(QLabel("fraction:"))
+        tailbox.addWidget(self.tail_frac_le)
         
         
         # check current setup
@@ -215,14 +309,30 @@ class ApplicationWindow(QMainWindow):
         tmbox.addWidget(QLabel("Plot"))
         tmbox.addWidget(QLabel("Energy range (keV)"))
         tmbox.addLayout(rangebox)
+        self.chkbox_adaptive = QCheckBox("Adaptive grid (dense near lines/edges)")
+        self.chkbox_adaptive.setChecked(False)
+        tmbox.addWidget(self.chkbox_adaptive)
         tmbox.addWidget(plotButton)
-        tmbox.addWidget(saveButton)
+        savebox=QHBoxLayout()
+        savebox.addWidget(saveButton)
+        savebox.addWidget(self.save_fmt_cb)
+        savebox.addWidget(self.channels_le)
+        tmbox.addLayout(savebox)
+        tmbox.addLayout(poissonbox)
+        tmbox.addLayout(progbox)
         self.chkbox_resol = QCheckBox("Detector resolution FWHM (eV)")
         self.chkbox_resol.stateChanged.connect(self.chkbox_resol_action)
         self.chkbox_resol.setChecked(True)
         #tmbox.addWidget(QLabel("Detector resolution FWHM (eV)"))
         tmbox.addWidget(self.chkbox_resol)
         tmbox.addWidget(self.detector_resolution_le)
+        tmbox.addWidget(QLabel("Resolution model (Fano: FWHM above is the noise)"))
+        tmbox.addWidget(self.resol_cb)
+        self.chkbox_tail = QCheckBox("Low-energy tail (FFT response)")
+        self.chkbox_tail.stateChanged.connect(self.apply_tail)
+        self.chkbox_tail.setChecked(False)
+        tmbox.addWidget(self.chkbox_tail)
+        tmbox.addLayout(tailbox)
         tmbox.addWidget(QLabel("Solidangle ratio (0.-1.)"))
         tmbox.addWidget(self.detector_solidangle_le)
         
@@ -230,6 +340,23 @@ class ApplicationWindow(QMainWindow):
         tmbox.addWidget(QLabel("Current setting"))
         tmbox.addWidget(self.cc_table)
         tmbox.addWidget(QLabel("X-ray lines"))
+        # every IUPAC line (incl. M lines), weak lines pruned
+        self.chkbox_all_lines = QCheckBox("All IUPAC lines, threshold:")
+        self.chkbox_all_lines.setChecked(False)
+        self.chkbox_all_lines.stateChanged.connect(self.apply_line_threshold)
+        self.line_threshold_le = QLineEdit()
+        self.line_threshold_le.setValidator(QDoubleValidator(0.,1.,999))
+        self.line_threshold_le.returnPressed.connect(self.apply_line_threshold)
+        self.line_threshold_le.setText(str(self.line_threshold))
+        allbox=QHBoxLayout()
+        allbox.addWidget(self.chkbox_all_lines)
+        allbox.addWidget(self.line_threshold_le)
+        tmbox.addLayout(allbox)
+        # target lines excited by other target lines (matrix enhancement)
+        self.chkbox_secondary = QCheckBox("Secondary fluorescence")
+        self.chkbox_secondary.setChecked(False)
+        self.chkbox_secondary.stateChanged.connect(self.apply_secondary)
+        tmbox.addWidget(self.chkbox_secondary)
         tmbox.addWidget(self.line_table)
         topmiddle.setLayout(tmbox)
        
@@ -327,12 +454,37 @@ class ApplicationWindow(QMainWindow):
         dic=default.read_default_csv(fname)
         self.detector_resolution_le.setText(dic['detector_resolution'][0])
         self.detector_solidangle_le.setText(dic['detector_solidangle'][0])
+        self.resolution_from_csv=None
+        self.resol_cb.setCurrentIndex(0)
+        if len(dic.get('resolution_model',[]))>0:
+            self.resolution_from_csv=resolution.from_spec(dic['resolution_model'],float(dic['detector_resolution'][0]))
+            self.resol_cb.setCurrentIndex(self.RESOL_MODELS.index("From csv"))
+        if len(dic.get('tail_tau',[]))>0 and len(dic.get('tail_frac',[]))>0:
+            self.tail_tau_le.setText(dic['tail_tau'][0])
+            self.tail_frac_le.setText(dic['tail_frac'][0])
+            self.chkbox_tail.setChecked(True)
+        else:
+            self.chkbox_tail.setChecked(False)
         
         self.bemtab.bem_beamene_le.setText(dic['beam_energy'][0])
         self.bemtab.bem_beamalpha_le.setText(dic['beam_alpha'][0])
         self.bemtab.bem_beambeta_le.setText(dic['beam_beta'][0])
         self.bemtab.bem_beamflux_le.setText(dic['beam_flux'][0])
         self.bemtab.bem_time_le.setText(dic['beam_time'][0])
+        # optional incident spectrum (tube,W,50,Be,127 or table,file.csv)
+        self.bemtab.bem_spec_cb.setCurrentIndex(0)
+        if len(dic.get('beam_spectrum',[]))>0:
+            spec=beam_spectrum.from_entry(dic['beam_spectrum'])
+            if spec['kind']=='tube':
+                self.bemtab.bem_anode_le.setText(spec['anode'])
+                self.bemtab.bem_kv_le.setText(str(spec['kV']))
+                if 'window' in spec: self.bemtab.bem_window_le.setText(spec['window'])
+                if 'window_um' in spec: self.bemtab.bem_window_um_le.setText(str(spec['window_um']))
+                self.bemtab.bem_takeoff_le.setText(str(spec.get('takeoff',20.)))
+                self.bemtab.bem_spec_cb.setCurrentIndex(1)
+            else:
+                self.bemtab.bem_spec_file=spec['table']
+                self.bemtab.bem_spec_cb.setCurrentIndex(2)
         self.bemtab.add_beam()
         print(self.bem['beamene'],self.bem['beamalpha'],self.bem['beambeta'],self.bem['beamflux'],self.beam_duration)
 
@@ -344,7 +496,7 @@ class ApplicationWindow(QMainWindow):
             else:
                 self.tgttab.mat_dens_le.setText(dic['target_density'][i])
                 self.tgttab.apply_mat_cp()
-            self.tgttab.add_material()
+            self.tgttab.add_material(layer=i>0)# several targets: layers
 
         for i in range(len(dic['detector'])):
             self.dettab.mat_thick_le.setText(dic['detector_thickness'][i])
@@ -371,6 +523,15 @@ class ApplicationWindow(QMainWindow):
             self.bettab.nist_cb.setCurrentIndex(int(dic['NIST_CP_ID'][i])+1)
             self.bettab.add_material()
 
+        if len(dic.get('adc_channels',[]))>0:
+            self.channels_le.setText(",".join(dic['adc_channels']))
+
+        # optional measured curves: built-in name (e.g., LUXELHT) or csv file
+        for entry in dic.get('filter_table',[]):
+            self.bettab.add_table(tabulated.layer_from(entry,self.csvd))
+        for entry in dic.get('detector_table',[]):
+            self.dettab.add_table(tabulated.layer_from(entry,self.csvd))
+
         for i in range(len(dic['radionuclide'])):
             self.radtab.rad_act_le.setText(dic['activity_calib'][i])
             self.radtab.rad_date_le.setText(dic['date_calib'][i])
@@ -452,6 +613,38 @@ class ApplicationWindow(QMainWindow):
             print("Detector resolution is not considered")
 
 
+    def _resolution(self):
+        # constant FWHM (eV) or an energy dependent resolution model
+        # (none at all when the resolution box is unchecked)
+        if not self.chkbox_resol.isChecked(): return 0.
+        model=self.resol_cb.currentText()
+        if model.startswith("Fano"):
+            return resolution.FanoResolution(material=model[6:-1],noise=self.detector_resolution)
+        elif model=="From csv" and self.resolution_from_csv is not None:
+            return self.resolution_from_csv
+        return self.detector_resolution
+
+
+    def _resolution_label(self):
+        res=self._resolution()
+        if np.isscalar(res): return "%.1f eV"%(res)
+        return repr(res)
+
+
+    def apply_tail(self):
+        if not self.chkbox_tail.isChecked():
+            self.tail_tau=0.
+            self.tail_frac=0.
+            return
+        try:
+            self.tail_tau=float(self.tail_tau_le.text())
+            self.tail_frac=float(self.tail_frac_le.text())
+        except:
+            sys.stderr.write('Error: input is not valid\n')
+            self.tail_tau=0.
+            self.tail_frac=0.
+
+
     def apply_detector_solidangle(self):
         s=self.detector_solidangle_le.text()
         if s!="":
@@ -461,208 +654,118 @@ class ApplicationWindow(QMainWindow):
             self.detector_solidangle_le.setText("1.")
 
 
-    def _transmission(self):
-        trans_all=np.ones_like(self.enes_keV,dtype=np.float64)
-        trans_each=[]
-        if len(self.bets)==0:
-            sys.stderr.write('Warning: no filter materials data\n')
-            return trans_all,trans_each
-        if "name" not in [*self.bets[0].keys()]:
-            sys.stderr.write('Warning: no filter materials data\n')
-            return trans_all,trans_each
-        for bet in self.bets:
-            name=bet['name']
-            thickness=bet['thickness']
-            density=bet['density']
-            if (name=="LUXELHT"):# <- use LUXEL HT window
-                each = self._trans_luxel_ht_window()
-            else:
-                each=np.exp(-np.array([xrl.CS_Total_CP(name,E) for E in self.enes_keV])*density*thickness)
-            trans_each.append(each)
-            trans_all=trans_all*each
-        return trans_all,trans_each
-
-
-    def _trans_luxel_ht_window(self):
-        df = pd.read_csv(self.csvd+"LUXEL_filter_HT_large.csv")
-        ene = np.array(df['ev'].values,dtype=float)
-        tra = np.array(df['trans'].values,dtype=float)
-        f = interp1d(ene, tra)
-        each = f(self.enes_keV*1e3)/100.
-        return each
-    
-
-    def _photoel(self):
-        phabs_all=np.ones_like(self.enes_keV,dtype=np.float64)
-        phabs_each=[]
-        if len(self.dets)==0:
-            sys.stderr.write('Warning: _photoel, no detector set\n')
-            return phabs_all,phabs_each
-        if "name" not in [*self.det.keys()]:
-            sys.stderr.write('Warning: _photoel, no detector name\n')
-            return phabs_all,phabs_each
-        for det in self.dets:
-            name=det['name']
-            thickness=det['thickness']
-            density=det['density']
-            each=np.exp(-np.array([xrl.CS_Photo_CP(name,E) for E in self.enes_keV])*density*thickness)
-            phabs_each.append(1.-each)
-            phabs_all=phabs_all*each
-        phabs_all=1.-phabs_all
-        return phabs_all,phabs_each
-
-
-    def _absall(self):
-        phabs_all=np.ones_like(self.enes_keV,dtype=np.float64)
-        phabs_each=[]
-        if len(self.dets)==0:
-            sys.stderr.write('Warning: _photoel, no detector set\n')
-            return phabs_all,phabs_each
-        if "name" not in [*self.det.keys()]:
-            sys.stderr.write('Warning: _photoel, no detector name\n')
-            return phabs_all,phabs_each
-        for det in self.dets:
-            name=det['name']
-            thickness=det['thickness']
-            density=det['density']
-            each=np.exp(-np.array([xrl.CS_Total_CP(name,E) for E in self.enes_keV])*density*thickness)
-            phabs_each.append(1.-each)
-            phabs_all=phabs_all*each
-        phabs_all=1.-phabs_all
-        return phabs_all,phabs_each
-        
+    def apply_line_threshold(self):
+        s=self.line_threshold_le.text()
+        if s!="":
+            self.line_threshold=float(s)
+        else:
+            self.line_threshold=1e-4
+            self.line_threshold_le.setText("1e-4")
+        self.update_line_table()
+
+
+    def apply_secondary(self):
+        self.update_line_table()
+
+
+    def _model(self):
+        # headless calculation core with the current GUI settings
+        return yield_model.YieldModel(**self._model_settings())
+
+
+    def _model_settings(self):
+        # YieldModel arguments read from the widgets (GUI thread); workers
+        # build the model themselves, the adaptive grid needs the line tables
+        # snapshot: the tabs keep editing their dicts while a job runs
+        return dict(tgt=copy.deepcopy(self.tgt),
+                    tgt_layers=copy.deepcopy(self.tgts) if len(self.tgts)>1 else None,
+                    dets=copy.deepcopy(self.dets),bets=copy.deepcopy(self.bets),
+                    bem=copy.deepcopy(self.bem),rads=copy.deepcopy(self.rads),
+                    er_low=self.er_low,er_high=self.er_high,er_step=self.er_step,
+                    detector_resolution=self._resolution(),
+                    detector_solidangle=self.detector_solidangle,
+                    beam_duration=self.beam_duration,rad_duration=self.rad_duration,
+                    not_draw_lines=list(self.not_draw_lines),
+                    csvd=self.csvd,cache=self.atten_cache,
+                    profile_method='fft' if self.chkbox_tail.isChecked() else 'voigt',
+                    tail_tau=self.tail_tau,tail_frac=self.tail_frac,
+                    grid_mode='adaptive' if self.chkbox_adaptive.isChecked() else 'uniform',
+                    context=self.compute_ctx,
+                    all_lines=self.chkbox_all_lines.isChecked(),
+                    line_threshold=self.line_threshold,
+                    secondary=self.chkbox_secondary.isChecked())
+
+
+    def _apply_plot_settings(self):
+        self.apply_enerangelow()
+        if self.er_low<=0.1: self.er_low=0.1
+        self.apply_enerangehigh()
+        self.apply_enerangestep()
+        self.apply_detector_resolution()
+        self.apply_detector_solidangle()
+        self.apply_tail()
 
-    def _selfabs_corr(self,z,line):
-        if "name" not in [*self.tgt.keys()]:
-            sys.stderr.write('Warning: _selfabs_corr, tgt has no name\n')
-            return 0.
-        name=self.tgt['name']
-        thickness=self.tgt['thickness']
-        density=self.tgt['density']
-        beamene=self.bem['beamene']
-        alpha=self.bem['beamalpha']
-        beta=self.bem['beambeta']
-        try:
-            mu_0=xrl.CS_Total_CP(name, beamene)
-        except:
-            return 0.
-        try:
-            mu_1 = xrl.CS_Total_CP(name, line_wrap.get_lineenergy(z,line))
-        except:
-            return 0.
-        chi = mu_0/np.sin(np.pi/180.*alpha) + mu_1/np.sin(np.pi/180.*beta)
-        A_corr = (1.0-np.exp(-chi*density*thickness))/(chi*density*thickness)
-        return A_corr
 
-    
-    def _xrf_intensity(self,z,line):
-        if "name" not in [*self.tgt.keys()]:
-            sys.stderr.write('Error: _xrf_intensity, tgt has no name\n')
-            return 0.
-        beamene=self.bem['beamene']
-        thickness=self.tgt['thickness']
-        density=self.tgt['density']
-        nel=self.tgt['nElements']
-        els=[*self.tgt['Elements']]# Z
-        massfr=[*self.tgt['massFractions']]
-        el_ind=np.where(np.array(els)==z)[0][0]
-        A_corr = self._selfabs_corr(z,int(line))
-        try:
-            Q = xrl.CS_FluorLine_Kissel(z,int(line),beamene)
-        except:
-            Q=0.
-        # printf check
-        #if (int(line)==-3):
-        #    print("---------------------------------------------")
-        #    print("Element: ",z)
-        #    print("beam (keV): ",beamene)
-        #    print("Q: %.3f"%(Q))
-        #    print("mass fraction: %.3f"%(massfr[el_ind]))
-        #    print("A_corr: %.3f"%(A_corr))
-        return Q * massfr[el_ind] * density * thickness * A_corr
-
-
-    def _update_line_table_by_radionuclide(self):
-        if len(self.rads)==0:
+    def _update_line_table_by_radionuclide(self,rls):
+        # rls: radionuclide_lines of every source
+        if len(rls)==0:
             sys.stderr.write('Warning: update_line_table_by_radionulide, rads has no member\n')
             #self.line_table.setRowCount(0)# reset rows
             return
-        for i,rad in enumerate(self.rads):
-            name=rad['name']
-            Z=rad['Z']
-            elSource=xrl.AtomicNumberToSymbol(Z)
-            Z_xray=rad['Z_xray']
-            elXray=xrl.AtomicNumberToSymbol(Z_xray)
-            nXrays=rad['nXrays']
-            nGammas=rad['nGammas']
-            XrayLines=list(rad['XrayLines'])
-            XrayLineTypes=[self.IUPACmac[self.allLINES.index(xl)].split('_')[0] for xl in XrayLines]
-            XrayEnergies=np.array([line_wrap.get_lineenergy(Z_xray,line) for line in XrayLines])
-            XrayWidths=np.array([line_wrap.get_linewidth(Z_xray,linetype) for linetype in XrayLineTypes])*1e3# eV
-            XrayIntensities=np.array(list(rad['XrayIntensities']))
-            GammaEnergies=np.array(list(rad['GammaEnergies']))
-            GammaIntensities=np.array(list(rad['GammaIntensities']))
+        # rows of all sources first (decoded line tables are cached per
+        # nuclide), then the table grows once
+        rows=[]
+        for i,rl in enumerate(rls):
+            src="%s %d"%(self.radtab.RADIONUCL_STR,i+1)
             # Xray
-            for lt,ene,gamma,norm in zip(XrayLineTypes,XrayEnergies,XrayWidths,XrayIntensities):
-                if ene>0. and gamma>0. and norm>0.:
-                    row=self.line_table.rowCount()
-                    self.line_table.insertRow(row)
-                    chk = QCheckBox(parent=self.line_table)
-                    chk.setChecked(True)
-                    chk.clicked.connect(self._line_table_chkChanged)
-                    self.line_table.setCellWidget(row, 0, chk)
-                    self.line_table.setItem(row,1, QTableWidgetItem(elXray))
-                    self.line_table.setItem(row,2, QTableWidgetItem(lt))
-                    self.line_table.setItem(row,3, QTableWidgetItem("%.5f"%(ene)))
-                    self.line_table.setItem(row,4, QTableWidgetItem("%.5f"%(gamma)))
-                    self.line_table.setItem(row,5, QTableWidgetItem("%.5e"%(norm)))
-                    self.line_table.setItem(row,6, QTableWidgetItem("%s %d"%(self.radtab.RADIONUCL_STR,i+1)))
+            k=np.where((rl['xray_energy']>0.) & (rl['xray_width']>0.) & (rl['xray_intensity']>0.))[0]
+            rows+=[(rl['elXray'],rl['xray_linetype'][j],rl['xray_energy'][j],rl['xray_width'][j],rl['xray_intensity'][j],src) for j in k]
             # Gamma-ray
-            for ene,norm in zip(GammaEnergies,GammaIntensities):
-                if ene>0. and norm>0.:
-                    row=self.line_table.rowCount()
-                    self.line_table.insertRow(row)
-                    chk = QCheckBox(parent=self.line_table)
-                    chk.setChecked(True)
-                    chk.clicked.connect(self._line_table_chkChanged)
-                    self.line_table.setCellWidget(row, 0, chk)
-                    self.line_table.setItem(row,1, QTableWidgetItem(name))
-                    self.line_table.setItem(row,2, QTableWidgetItem("Gamma"))
-                    self.line_table.setItem(row,3, QTableWidgetItem("%.5f"%(ene)))
-                    self.line_table.setItem(row,4, QTableWidgetItem("%.5f"%(0.001)))
-                    self.line_table.setItem(row,5, QTableWidgetItem("%.5e"%(norm)))
-                    self.line_table.setItem(row,6, QTableWidgetItem("%s %d"%(self.radtab.RADIONUCL_STR,i+1)))
+            k=np.where((rl['gamma_energy']>0.) & (rl['gamma_intensity']>0.))[0]
+            rows+=[(rl['name'],"Gamma",rl['gamma_energy'][j],0.001,rl['gamma_intensity'][j],src) for j in k]
+        row0=self.line_table.rowCount()
+        self.line_table.setRowCount(row0+len(rows))
+        for row,(name,lt,ene,gamma,norm,src) in enumerate(rows,row0):
+            chk = QCheckBox(parent=self.line_table)
+            chk.setChecked(True)
+            chk.clicked.connect(self._line_table_chkChanged)
+            self.line_table.setCellWidget(row, 0, chk)
+            self.line_table.setItem(row,1, QTableWidgetItem(name))
+            self.line_table.setItem(row,2, QTableWidgetItem(lt))
+            self.line_table.setItem(row,3, QTableWidgetItem("%.5f"%(ene)))
+            self.line_table.setItem(row,4, QTableWidgetItem("%.5f"%(gamma)))
+            self.line_table.setItem(row,5, QTableWidgetItem("%.5e"%(norm)))
+            self.line_table.setItem(row,6, QTableWidgetItem(src))
 
     def update_line_table(self):
-        if "name" not in [*self.tgt.keys()]:
+        # line tables on a worker (target_lines with secondary fluorescence
+        # or all lines takes a while), the table is filled when done; an
+        # update still running is cancelled
+        settings=self._model_settings()
+        if self.table_worker is not None: self.table_worker.cancel()
+        self.table_worker=self._start_worker(lambda report: self._line_table_job(settings,report),self._line_table_done)
+
+
+    def _line_table_job(self,settings,report):
+        model=yield_model.YieldModel(progress=report,**settings)
+        lt=model.target_lines() if model.has_target() else None
+        return lt,[model.radionuclide_lines(rad) for rad in model.rads]
+
+
+    def _line_table_done(self,out):
+        if self.sender() is not self.table_worker: return# stale
+        self.table_worker=None
+        lt,rls=out
+        if lt is None:
             sys.stderr.write('Warning: update_line_table, tgt has no name\n')
             self.line_table.setRowCount(0)# reset rows
-            if len(self.rads)!=0: self._update_line_table_by_radionuclide()
+            if len(rls)!=0: self._update_line_table_by_radionuclide(rls)
             return
         #print("update_line_table")
-        name=self.tgt['name']
-        zs=[*self.tgt['Elements']]
-        lines=[xrl.__getattribute__('%s_LINE'%(x)) for x in self.LINES]
-        linetypes=np.array([l for l in self.LINES for z in zs])
-        sgblinetypes=np.array([l for l in self.SGBLINES for z in zs])
-        els=np.array([xrl.AtomicNumberToSymbol(z) for i in range(len(lines)) for z in zs])
-        el_inds=np.array([i for k in range(len(lines)) for i,z in enumerate(zs)])
-        enes=np.array([line_wrap.get_lineenergy(z,line) for line in lines for z in zs])
-        gammas=np.array([line_wrap.get_linewidth(z,lt) for lt in self.LINES for z in zs])*1e3
-        intens=np.array([self._xrf_intensity(z,line) for line in lines for z in zs])
-        # remove non-valid lines
-        indx=np.where((enes!=0.) & (intens!=0.))[0]
-        els=els[indx]
-        el_inds=el_inds[indx]
-        enes=enes[indx]
-        gammas=gammas[indx]
-        intens=intens[indx]
-        linetypes=linetypes[indx]
-        sgblinetypes=sgblinetypes[indx]
         # fill tabel
         self.line_table.setRowCount(0)# reset rows
-        self.line_table.setRowCount(len(els))
-        for i,(el,lt,sgblt,ene,gamma,norm) in enumerate(zip(els,linetypes,sgblinetypes,enes,gammas,intens)):
+        self.line_table.setRowCount(len(lt['el']))
+        for i,(el,sgblt,ene,gamma,norm) in enumerate(zip(lt['el'],lt['sgblinetype'],lt['energy'],lt['width'],lt['intensity'])):
             if ene>0. and gamma>0. and norm>0.:
                 chk = QCheckBox(parent=self.line_table)
                 chk.setChecked(True)
@@ -673,8 +776,8 @@ class ApplicationWindow(QMainWindow):
                 self.line_table.setItem(i,3, QTableWidgetItem("%.5f"%(ene)))
                 self.line_table.setItem(i,4, QTableWidgetItem("%.5f"%(gamma)))
                 self.line_table.setItem(i,5, QTableWidgetItem("%.5e"%(norm)))
-                self.line_table.setItem(i,6, QTableWidgetItem(name))
-        if len(self.rads)!=0: self._update_line_table_by_radionuclide()
+                self.line_table.setItem(i,6, QTableWidgetItem(lt['name']))
+        if len(rls)!=0: self._update_line_table_by_radionuclide(rls)
 
         
     def _line_table_chkChanged(self):
@@ -686,12 +789,109 @@ class ApplicationWindow(QMainWindow):
                 el=self.line_table.item(i,1).text()
                 lt=self.line_table.item(i,2).text()
                 self.not_draw_lines.append(el+lt)
-        self._update_fluor_cv()
+        self._toggle_fluor_cv()
+
+
+    def _toggle_fluor_cv(self):
+        # only the drawn lines changed: component spectra come from the compute
+        # context (at most one line is recomputed, on a worker like Plot) and
+        # the plotted curves are updated in place; a Plot still running is
+        # started again with the new lines
+        if self.plot_worker is not None:
+            self._plot_trans_fluor()
+            return
+        settings=self._model_settings()
+        self.plot_worker=self._start_worker(lambda report: self._toggle_job(settings,report),self._toggle_done)
+
+
+    def _toggle_job(self,settings,report):
+        model=yield_model.YieldModel(progress=report,**settings)
+        return model.fluorescence()
+
+
+    def _toggle_done(self,out):
+        if self.sender() is not self.plot_worker: return# stale
+        self.plot_worker=None
+        flout,components=out
+        if [c[0] for c in components]!=[a[0] for a in self.fl_artists]:
+            self._plot_trans_fluor()
+            return
+        self.flout=flout
+        for (label,art),(l,spec,kind) in zip(self.fl_artists,components):
+            art.set_ydata(spec)
+        self.ax_fl.relim()
+        self.ax_fl.autoscale_view()
+        self.ax_fl.figure.canvas.draw_idle()
 
 
     def _plot_trans_fluor(self):
-        self._update_trans_cv()
-        self._update_fluor_cv()
+        # settings and line table on the GUI thread, the model and the
+        # calculation on a worker; a Plot still running is cancelled
+        self._apply_plot_settings()
+        if "name" in [*self.tgt.keys()]: self.bemtab.add_beam()
+        settings=self._model_settings()
+        if self.plot_worker is not None: self.plot_worker.cancel()
+        self.plot_worker=self._start_worker(lambda report: self._plot_job(settings,report),self._plot_done)
+
+
+    def _plot_job(self,settings,report):
+        model=yield_model.YieldModel(progress=report,**settings)
+        qe=model.qe()
+        flout,components=model.fluorescence(eff=qe['qe'])
+        return model,qe,flout,components
+
+
+    def _plot_done(self,out):
+        if self.sender() is not self.plot_worker: return# stale
+        self.plot_worker=None
+        model,qe,flout,components=out
+        self._draw_trans_cv(model,qe)
+        self._draw_fluor_cv(model,flout,components)
+        if self.debug:
+            print(self.atten_cache.report())
+            print(self.compute_ctx.report())
+
+
+    def _start_worker(self,job,done):
+        worker=Worker(job,parent=self)
+        worker.progress.connect(self._show_progress)
+        worker.done.connect(done)
+        worker.failed.connect(self._worker_failed)
+        worker.finished.connect(lambda: self._worker_finished(worker))
+        self.workers.append(worker)
+        worker.start()
+        return worker
+
+
+    def _worker_finished(self,worker):
+        if worker in self.workers: self.workers.remove(worker)
+        if len(self.workers)==0:
+            self.progress_bar.setFormat("idle")
+            self.progress_bar.setRange(0,1)
+            self.progress_bar.setValue(0)
+
+
+    def _worker_failed(self,msg):
+        sys.stderr.write('Error: %s\n'%(msg))
+
+
+    def _show_progress(self,stage,i,n):
+        self.progress_bar.setRange(0,max(n,1))
+        self.progress_bar.setValue(i)
+        self.progress_bar.setFormat("%s %d/%d"%(stage,i,n))
+
+
+    def _cancel_workers(self):
+        for worker in self.workers: worker.cancel()
+        self.plot_worker=None
+        self.table_worker=None
+
+
+    def wait_workers(self):
+        # block until the background calculations are done (scripts, tests)
+        while len(self.workers)>0:
+            self.workers[0].wait()
+            QApplication.processEvents()
 
 
     def _save_trans_fluor(self):
@@ -699,175 +899,141 @@ class ApplicationWindow(QMainWindow):
         # enes_keV, flout, qeout
         # -- specify folder? or automatic ? --
         savedir='./output'
+        ch=self._channels(self.enes_out)
+        if ch is None: return
         os.makedirs(savedir, exist_ok=True)
-        # - save -
-        default.save_numpy_arrays(self.enes_keV,self.qeout,'%s/qe.txt'%(savedir))
-        default.save_numpy_arrays(self.enes_keV,self.flout,'%s/fluor.txt'%(savedir))
-        # -- figure save --
+        # -- figure save -- (GUI thread)
         f_tr=default.file_check('%s/qe.pdf'%(savedir))
         self.fig_tr.savefig(f_tr,format='pdf')
         print('%s is created.'%(f_tr))
         f_fl=default.file_check('%s/fluor.pdf'%(savedir))
         self.fig_fl.savefig(f_fl,format='pdf')
         print('%s is created.'%(f_fl))
-        try :
-            import ROOT
-            frname=default.file_check('%s/out.root'%(savedir))
-            f_root=ROOT.TFile(frname,"recreate")
-            f_root.cd()
-            l=self.enes_keV[0]-self.er_step/2.
-            h=self.enes_keV[-1]+self.er_step/2.
-            nbin=int((h-l)/self.er_step)
-            hfluor = ROOT.TH1F("hfluor","hfluor",nbin,l,h)
-            for e,f in zip(self.enes_keV,self.flout):
-                i = hfluor.FindBin(e)
-                hfluor.SetBinContent(i,f)
-            gqe=ROOT.TGraph(len(self.enes_keV),self.enes_keV,self.qeout)
-            gqe.SetNameTitle("gqe","gqe")
-            gfl=ROOT.TGraph(len(self.enes_keV),self.enes_keV,self.flout)
-            gfl.SetNameTitle("gfl","gfl")
-            hfluor.Write()
-            gqe.Write()
-            gfl.Write()
-            f_root.Close()
-            print("%s is created."%(frname))
-        except ImportError:
+        fmt=self.save_fmt_cb.currentText()
+        if fmt!="txt":
+            # binary: model grid, per-layer curves, components and lines
+            settings=self._model_settings()
+            self._start_worker(lambda report: self._save_binary_job(savedir,fmt,settings,report),lambda out: None)
             return
+        # - save - (on the uniform grid, resampled if the adaptive grid is used)
+        enes=self.enes_out
+        qeout=egrid.resample(self.enes_keV,self.qeout,enes)
+        flout=egrid.resample(self.enes_keV,self.flout,enes)
+        hist=(self.enes_keV,self.flout)# counts per channel from the model grid
+        self._start_worker(lambda report: self._save_job(savedir,enes,qeout,flout,ch,hist,report),lambda out: None)
 
-        
-    def _update_fluor_cv_by_radionuclide(self):
-        if len(self.rads)==0:
-            sys.stderr.write('Warning: update_fluor_cv_by_radionulide, rads has no member\n')
-            #self.line_table.setRowCount(0)# reset rows
+
+    def _channels(self,enes):
+        s=self.channels_le.text().strip()
+        if s=="": return channels.Channels.from_grid(enes,self.er_step)
+        try:
+            return channels.Channels.from_spec(s.split(','))
+        except ValueError as e:
+            sys.stderr.write('Error: channels, %s\n'%(e))
+            return None
+
+
+    def _simulate_poisson(self):
+        # per-line detectability from Poisson realizations of the current
+        # settings (same channels as Save), one realization drawn on the plot
+        ch=self._channels(self.enes_out)
+        if ch is None: return
+        try:
+            n=int(self.poisson_n_le.text())
+            seed=int(self.poisson_seed_le.text())
+            bkg=float(self.poisson_bkg_le.text())
+        except ValueError:
+            sys.stderr.write('Error: input is not valid\n')
             return
-        #self.ax_fl.clear()
-        trans_all,trans_each=self._transmission()
-        phabs_all,phabs_each=self._photoel()
-        radtimesec=self.rad_duration# sec
-        solidangle=self.detector_solidangle
-        resolution=self.detector_resolution
-    
-        for i,rad in enumerate(self.rads):
-            activitytoday=rad['activitytoday']
-            name=rad['name']
-            Z_xray=rad['Z_xray']
-            elXray=xrl.AtomicNumberToSymbol(Z_xray)
-            nXrays=rad['nXrays']
-            nGammas=rad['nGammas']
-            XrayLines=list(rad['XrayLines'])
-            XrayLineTypes=[self.IUPACmac[self.allLINES.index(xl)].split('_')[0] for xl in XrayLines]
-            XrayEnergies=np.array([line_wrap.get_lineenergy(Z_xray,line) for line in XrayLines])
-            XrayWidths=np.array([line_wrap.get_linewidth(Z_xray,linetype) for linetype in XrayLineTypes])*1e3# eV
-            XrayIntensities=np.array(list(rad['XrayIntensities']))
-            GammaEnergies=np.array(list(rad['GammaEnergies']))
-            GammaIntensities=np.array(list(rad['GammaIntensities']))
-            
-            # Xray
-            specX=np.zeros_like(self.enes_keV,dtype=np.float64)
-            for lt,ene,gamma,norm in zip(XrayLineTypes,XrayEnergies,XrayWidths,XrayIntensities):
-                if ene>0. and gamma>0. and norm>0.:
-                    if elXray+lt in self.not_draw_lines: continue
-                    specX += activitytoday * radtimesec * solidangle * norm * trans_all * phabs_all * voigt(self.enes_keV*1e3,ene*1e3,gamma/2.,resolution/sigma_from_fwhm)
-                    
-            # Gamma-ray
-            specG=np.zeros_like(self.enes_keV,dtype=np.float64)
-            for ene,norm in zip(GammaEnergies,GammaIntensities):
-                if ene>0. and norm>0.:
-                    if name+"Gamma" in self.not_draw_lines: continue
-                    specG += activitytoday * radtimesec * solidangle * norm * trans_all * phabs_all * voigt(self.enes_keV*1e3,ene*1e3,1.0/2.,resolution/sigma_from_fwhm)
-
-            self.flout+=specX
-            self.flout+=specG
-            self.ax_fl.plot(self.enes_keV,specX,linestyle='-',marker='',label=elXray)
-            self.ax_fl.plot(self.enes_keV,specG,linestyle='-',marker='',label=name)
-            self.ax_fl.legend(loc='upper right',fontsize=8)
-            self.ax_fl.set_xlabel("Energy (keV)")
-            self.ax_fl.set_xlim(self.er_low,self.er_high)
-            if self.er_low<=0.1: self.ax_fl.set_xlim(0.,self.er_high)
-            self.ax_fl.set_ylabel("Normalized intensity")
-            self.ax_fl.figure.canvas.draw()
-        
+        settings=self._model_settings()
+        self._start_worker(lambda report: self._poisson_job(settings,n,seed,bkg,ch,report),self._poisson_done)
+
+
+    def _poisson_job(self,settings,n,seed,bkg,ch,report):
+        model=yield_model.YieldModel(progress=report,**settings)
+        return poisson.simulate(model,n=n,seed=seed,background=bkg,ch=ch,report=report)
+
+
+    def _poisson_done(self,stats):
+        print("Poisson realizations: %d (seed %d), channels %s"%(stats['n'],stats['seed'],stats['channels']))
+        print(poisson.summary(stats))
+        # counts per eV, comparable with the expected spectrum
+        ch=stats['channels']
+        e=ch.edges()
+        self.ax_fl.stairs(stats['example']/(np.diff(e)*1e3),e,color='gray',alpha=0.6,label="Poisson (1st)")
+        self.ax_fl.legend(loc='upper right',fontsize=8)
+        self.ax_fl.figure.canvas.draw_idle()
+
+
+    def _save_binary_job(self,savedir,fmt,settings,report):
+        model=yield_model.YieldModel(progress=report,**settings)
+        if fmt=='npz':
+            # a configuration saved before is copied from the catalog
+            cat=catalog.Catalog('%s/catalog.sqlite'%(savedir))
+            cat.export(model,default.file_check('%s/result.npz'%(savedir)),report=report)
+            print(cat.report())
+        else:
+            results.save('%s/result.%s'%(savedir,fmt),model,report=report)
+
+
+    def _save_job(self,savedir,enes,qeout,flout,ch,hist,report):
+        report('write',0,3)
+        default.save_numpy_arrays(enes,qeout,'%s/qe.txt'%(savedir))
+        report('write',1,3)
+        default.save_numpy_arrays(enes,flout,'%s/fluor.txt'%(savedir))
+        report('write',2,3)
+        # histogram of the detector channels: out.root (PyROOT) or out.npz
+        channels.save('%s/out'%(savedir),ch,*hist,extra={'gqe':(enes,qeout),'gfl':(enes,flout)})
+
         
-    
     def _update_fluor_cv(self):
         #print("update_fluor_cv")
-        self.apply_enerangelow()
-        if self.er_low<=0.1: self.er_low=0.1
-        self.apply_enerangehigh()
-        self.apply_enerangestep()
-        self.apply_detector_resolution()
-        self.apply_detector_solidangle()
-        self.enes_keV=np.arange(self.er_low,self.er_high+self.er_low+self.er_step,self.er_step)
-        self.flout=np.zeros_like(self.enes_keV)
+        self._apply_plot_settings()
+        if "name" in [*self.tgt.keys()]: self.bemtab.add_beam()
+        model=self._model()
+        self._draw_fluor_cv(model,*model.fluorescence())
+
+
+    def _draw_fluor_cv(self,model,flout,components):
+        self.enes_keV=model.enes_keV
+        self.enes_out=model.uniform_grid()
         self.ax_fl.clear()
-        if "name" not in [*self.tgt.keys()]:
-            sys.stderr.write('Warning: update_fluor_cv, no target set\n')
+        self.fl_artists=[]
+        self.flout=flout
+        if not model.has_target():
             self.ax_fl.plot()
             self.ax_fl.figure.canvas.draw()
-            if len(self.rads)!=0:  self._update_fluor_cv_by_radionuclide()
-            return
-        trans_all,trans_each=self._transmission()
-        self.bemtab.add_beam()
-        flux=self.bem['beamflux']
-        beamtimesec=self.beam_duration# sec
-        title=self.tgt['name']
-        beamene = self.bem['beamene']
-        zs=[*self.tgt['Elements']]
-        phabs_all,phabs_each=self._photoel()
-        solidangle=self.detector_solidangle
-        resolution=self.detector_resolution
-        lines=np.array([xrl.__getattribute__('%s_LINE'%(x)) for x in self.LINES])
-        linetypes=np.array([l for l in self.LINES for z in zs])
-        sgblinetypes=np.array([l for l in self.SGBLINES for z in zs])
-        elms=[xrl.AtomicNumberToSymbol(z) for i in range(len(lines)) for z in zs]
-        els=np.array([xrl.AtomicNumberToSymbol(z) for i in range(len(lines)) for z in zs])
-        el_inds=np.array([i for k in range(len(lines)) for i,z in enumerate(zs)])
-        enes=np.array([line_wrap.get_lineenergy(z,line) for line in lines for z in zs])
-        gammas=np.array([line_wrap.get_linewidth(z,lt) for lt in self.LINES for z in zs])*1e3# eV
-        intens=np.array([self._xrf_intensity(z,line) for line in lines for z in zs])
-        # remove non-valid lines
-        indx=np.where((enes!=0.) & (intens!=0.))[0]
-        els=els[indx]
-        el_inds=el_inds[indx]
-        enes=enes[indx]
-        gammas=gammas[indx]
-        intens=intens[indx]
-        linetypes=linetypes[indx]
-        sgblinetypes=sgblinetypes[indx]
-        specs=[np.zeros_like(self.enes_keV,dtype=np.float64) for i in range(len(zs))]
-        for i,(el,elind,lt,sgblt,ene,gamma,norm) in enumerate(zip(els,el_inds,linetypes,sgblinetypes,enes,gammas,intens)):
-            if ene>0. and gamma>0.:
-                if el+sgblt in self.not_draw_lines: continue
-                specs[elind] += flux * beamtimesec * solidangle * norm * trans_all * phabs_all * voigt(self.enes_keV*1e3,ene*1e3,gamma/2.,resolution/sigma_from_fwhm)
-        cindex={x:i for i,x in enumerate([xrl.AtomicNumberToSymbol(z) for z in zs])}
-        for el,spec in zip(elms,specs):
-            self.flout+=spec
-            self.ax_fl.plot(self.enes_keV,spec,linestyle='-',marker='',color=cm.jet(cindex[el]/len(cindex)),label=el)
-
-        if len(self.rads)!=0:  self._update_fluor_cv_by_radionuclide()
-            
+            if len(self.rads)==0: return
+        nel=len([c for c in components if c[2]=='target'])
+        for i,(label,spec,kind) in enumerate(components):
+            if kind=='target':
+                art,=self.ax_fl.plot(self.enes_keV,spec,linestyle='-',marker='',color=cm.jet(i/nel),label=label)
+            else:
+                art,=self.ax_fl.plot(self.enes_keV,spec,linestyle='-',marker='',label=label)
+            self.fl_artists.append((label,art))
         self.ax_fl.legend(loc='upper right',fontsize=8)
         self.ax_fl.set_xlabel("Energy (keV)")
         self.ax_fl.set_xlim(self.er_low,self.er_high)
         if self.er_low<=0.1: self.ax_fl.set_xlim(0.,self.er_high)
         self.ax_fl.set_ylabel("Normalized intensity")
-        self.ax_fl.set_title("%s, beam %.3f keV, resol %.1f eV"%(title,beamene,resolution))
+        if model.has_target():
+            self.ax_fl.set_title("%s, %s, resol %s"%(model.tgt['name'],beam_spectrum.label(self.bem),self._resolution_label()))
         self.ax_fl.figure.canvas.draw()
 
         
     def _update_trans_cv(self):
-        self.apply_enerangelow()
-        if self.er_low<=0.1: self.er_low=0.1
-        self.apply_enerangehigh()
-        self.apply_enerangestep()
-        self.apply_detector_resolution()
-        self.apply_detector_solidangle()
-        self.enes_keV=np.arange(self.er_low,self.er_high+self.er_low+self.er_step,self.er_step)
-        self.qeout=np.zeros_like(self.enes_keV)
+        self._apply_plot_settings()
+        model=self._model()
+        self._draw_trans_cv(model,model.qe())
+
+
+    def _draw_trans_cv(self,model,qe):
+        self.enes_keV=model.enes_keV
+        self.enes_out=model.uniform_grid()
         self.ax.clear()
-        trans_all,trans_each=self._transmission()
-        phabs_all,phabs_each=self._photoel()
-        abs_all,abs_each=self._absall()
+        trans_all,trans_each=qe['trans_all'],qe['trans_each']
+        phabs_all,phabs_each=qe['phabs_all'],qe['phabs_each']
+        #abs_all,abs_each=model.absall()
         if len(trans_each)!=0:
             for tr,bet in zip(trans_each,self.bets):
                 self.ax.plot(self.enes_keV,tr,'--',label="trns %s %.2e"%(bet['name'],bet['thickness']))
@@ -880,7 +1046,7 @@ class ApplicationWindow(QMainWindow):
         #    for ph,det in zip(abs_each,self.dets):
         #        self.ax.plot(self.enes_keV,ph,'--',label="totalabs %s %.2e"%(det['name'],det['thickness']))
         #    self.ax.plot(self.enes_keV,abs_all,'-',label="totalabs all")
-        self.qeout=trans_all*phabs_all
+        self.qeout=qe['qe']
         self.ax.plot(self.enes_keV, self.qeout,'-',color='black',label="trans x phabs")
         self.ax.legend(loc='upper right',fontsize=8)
         self.ax.set_xlabel("Energy (keV)")
@@ -914,8 +1080,14 @@ class ApplicationWindow(QMainWindow):
 
 if __name__ == "__main__":
     # GUI
-    app = QApplication(sys.argv)
-    aw = ApplicationWindow()
+    parser=argparse.ArgumentParser(description="xray yield simulation")
+    parser.add_argument('--csvd',default='./csv/',help="directory of IUPAC_macro.csv etc.")
+    parser.add_argument('--cachedir',default=None,
+                        help="attenuation cache directory (default: $XYS_CACHEDIR or ~/.cache/xys)")
+    parser.add_argument('--debug',action='store_true',help="print the cache reports after every Plot")
+    args,qtargs=parser.parse_known_args()
+    app = QApplication(sys.argv[:1]+qtargs)
+    aw = ApplicationWindow(csvd=args.csvd,cachedir=args.cachedir,debug=args.debug)
     aw.show()
     signal.signal(signal.SIGINT, aw.exit_handler)
     sys.exit(app.exec_())
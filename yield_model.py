@@ -0,0 +1,844 @@
+import sys
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from datetime import datetime
+
+import xraylib as xrl
+
+import line_wrap
+import xsection
+import resolution
+import egrid
+import line_db
+import tabulated
+import secondary
+import beam_spectrum
+
+sigma_from_fwhm=2.*np.sqrt(2.*np.log(2))
+
+# IUPAC macro
+LINES=['KL3','KL2','KM3','KM2',
+       'L3M5','L3M4','L2M4','L3N5',
+       'L1M3','L1M2','L2N4','L3M1']
+# Siegbahn
+SGBLINES=['KA1','KA2','KB1','KB3',
+          'LA1','LA2','LB1','LB2',
+          'LB3','LB4','LG1','LL']
+
+# half life of the radionuclides in xrl.GetRadioNuclideDataList()
+#['55Fe','57Co','109Cd','125I','137Cs',
+#'133Ba','153Gd','238Pu','241Am','244Cm']
+RDNHL=[1006.70,272.11,463.26,59.49,11018.3,
+       3854.7,239.472,32031.74,157857.678,6610.52]# days
+
+
+def _digest(obj,h):
+    # feed a (nested) model input into a hash: arrays by content, dicts by
+    # sorted keys, objects (e.g., resolution models) by their attributes
+    if isinstance(obj,np.ndarray):
+        h.update(str(obj.dtype).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj,dict):
+        h.update(b'{')
+        for k in sorted(obj,key=str):
+            h.update(repr(k).encode())
+            _digest(obj[k],h)
+        h.update(b'}')
+    elif isinstance(obj,(list,tuple)):
+        h.update(b'[')
+        for x in obj: _digest(x,h)
+        h.update(b']')
+    elif hasattr(obj,'__dict__'):
+        h.update(type(obj).__name__.encode())
+        _digest(vars(obj),h)
+    else:
+        h.update(repr(obj).encode())
+
+
+def _plain(obj):
+    # model input as json types (arrays as lists, objects by their attributes)
+    if isinstance(obj,np.ndarray): return obj.tolist()
+    if isinstance(obj,np.generic): return obj.item()
+    if isinstance(obj,dict): return {str(k):_plain(v) for k,v in obj.items()}
+    if isinstance(obj,(list,tuple)): return [_plain(x) for x in obj]
+    if hasattr(obj,'__dict__'): return dict(_plain(vars(obj)),model=type(obj).__name__)
+    if obj is None or isinstance(obj,(bool,int,float,str)): return obj
+    return repr(obj)
+
+
+def _nbytes(obj):
+    if isinstance(obj,np.ndarray): return obj.nbytes
+    if isinstance(obj,dict): return sum(_nbytes(v) for v in obj.values())
+    if isinstance(obj,(list,tuple)): return sum(_nbytes(v) for v in obj)
+    return 0
+
+
+# memo of the arrays shared by the consumers of a plot (grid, per-layer
+# transmission/absorption, line tables, line spectra), keyed on a hash of
+# their inputs, so a context kept across redraws recomputes only what changed
+# (least recently used entries dropped above max_bytes)
+class ComputeContext(object):
+    def __init__(self, max_bytes=512*1024**2):
+        self.max_bytes=max_bytes
+        self.memo=OrderedDict()
+        self.nbytes=0
+        self.hits=0
+        self.misses=0
+        self.lock=threading.Lock()# shared with worker threads
+
+
+    def key(self,*args):
+        h=hashlib.sha1()
+        _digest(args,h)
+        return h.hexdigest()
+
+
+    def get(self,args,func):
+        # args: tuple of everything func depends on
+        k=self.key(*args)
+        with self.lock:
+            if k in self.memo:
+                self.memo.move_to_end(k)
+                self.hits+=1
+                return self.memo[k]
+            self.misses+=1
+        val=func()
+        with self.lock:
+            if k not in self.memo:
+                self.memo[k]=val
+                self.nbytes+=_nbytes(val)
+            while self.nbytes>self.max_bytes and len(self.memo)>1:
+                self.nbytes-=_nbytes(self.memo.popitem(last=False)[1])
+        return val
+
+
+    def clear(self):
+        with self.lock:
+            self.memo.clear()
+            self.nbytes=0
+            self.hits=0
+            self.misses=0
+
+
+    def report(self):
+        return "compute context: %d hits, %d misses, %d entries (%.1f MB)"%(self.hits,self.misses,len(self.memo),self.nbytes/1024.**2)
+
+
+# raised from a progress callback to abort a calculation
+class Cancelled(Exception):
+    pass
+
+
+# headless x-ray yield calculation (no Qt)
+# tgt:  target material dict (CompoundParser/NIST + name, thickness, density)
+# dets: list of detector material dicts
+# bets: list of filter material dicts
+# bem:  beam dict (beamene, beamalpha, beambeta, beamflux), and optionally
+#       spectrum (beam_spectrum.py) for a polychromatic beam
+# rads: list of radionuclide dicts (GetRadioNuclideDataByIndex + activitytoday)
+class YieldModel(object):
+    def __init__(self, tgt=None, dets=None, bets=None, bem=None, rads=None,
+                 er_low=0.1, er_high=20., er_step=0.001,
+                 detector_resolution=8.0, detector_solidangle=1.0,
+                 beam_duration=7200., rad_duration=3600.,
+                 not_draw_lines=None, csvd="./csv/", cache=None,
+                 profile_window=50., profile_tail='lorentz',
+                 profile_method='voigt', tail_tau=0., tail_frac=0.,
+                 grid_mode='uniform', atten_rtol=None, context=None, progress=None,
+                 all_lines=False, line_threshold=1e-4, tgt_layers=None, secondary=False):
+        self.tgt=tgt if tgt is not None else {}
+        self.dets=dets if dets is not None else []
+        self.bets=bets if bets is not None else []
+        self.bem=bem if bem is not None else {}
+        self.rads=rads if rads is not None else []
+        # layered target (coating on a substrate, film under a cap): layer
+        # dicts like tgt, beam side first; tgt then summarizes the stack
+        self.tgt_layers=list(tgt_layers) if tgt_layers else []
+        if len(self.tgt_layers)>0: self.tgt=stack_spec(self.tgt_layers)
+        self.er_low=er_low# keV
+        self.er_high=er_high# keV
+        self.er_step=er_step# keV
+        self.detector_resolution=detector_resolution# FWHM eV, or a resolution model
+        self.detector_solidangle=detector_solidangle
+        self.beam_duration=beam_duration# sec
+        self.rad_duration=rad_duration# sec
+        self.not_draw_lines=not_draw_lines if not_draw_lines is not None else []
+        self.csvd=csvd
+        self.cache=cache# atten_cache.AttenuationCache or None
+        # None: cross sections from xraylib at every energy
+        # value: log-log interpolation between edges within this relative error
+        self.atten_rtol=atten_rtol
+        # line profiles are evaluated within +-profile_window x FWHM (None: whole grid)
+        # outside: profile_tail='lorentz' (Lorentzian asymptote) or 'cut'
+        self.profile_window=profile_window
+        self.profile_tail=profile_tail
+        self.profile_error=0.# max fraction of a line area outside the window
+        # 'voigt': line by line Voigt profiles
+        # 'fft': sticks convolved once with the detector response including
+        #        an exponential low-energy tail (tail_tau in eV, tail_frac)
+        self.profile_method=profile_method
+        self.tail_tau=tail_tau
+        self.tail_frac=tail_frac
+        # line energies and widths of every element and IUPAC line
+        self.linedb=line_db.load(self.csvd)
+        self.IUPACmac=self.linedb.macros
+        self.allLINES=list(self.linedb.lines)
+        # target lines: LINES only, or every IUPAC line (incl. M lines) with the
+        # lines weaker than line_threshold x the strongest one pruned
+        self.all_lines=all_lines
+        self.line_threshold=line_threshold
+        # also secondary fluorescence: target lines excited by other target
+        # lines in the same layer (integrals memoized per layer, beam energy
+        # and geometry)
+        self.secondary=secondary
+        # 'uniform': er_step everywhere, 'adaptive': dense only near lines and edges
+        # (use uniform_grid()/to_uniform() for output on the requested uniform grid)
+        self.grid_mode=grid_mode
+        # shared memo, e.g. one ComputeContext for all models of a GUI redraw
+        self.context=context if context is not None else ComputeContext()
+        # progress(stage,i,n) is called at stage steps (transmission, detector,
+        # lines, profiles); it may raise Cancelled to abort
+        self.progress=progress
+        self.enes_keV=self.grid()
+        self.grid_key=self.context.key(self.enes_keV)
+
+
+    def report(self,stage,i,n):
+        if self.progress is not None: self.progress(stage,i,n)
+
+
+    def uniform_grid(self):
+        return egrid.uniform_grid(self.er_low,self.er_high,self.er_step)
+
+
+    def grid(self):
+        args=('grid',self.er_low,self.er_high,self.er_step,self.grid_mode)
+        if self.grid_mode=='adaptive':
+            args+=(self.tgt,self.tgt_layers,self._beam_key(),self.rads,self.dets,self.bets,
+                   self.detector_resolution,self.profile_window,self.csvd)
+        return self.context.get(args,self._grid)
+
+
+    def _grid(self):
+        if self.grid_mode=='uniform':
+            return self.uniform_grid()
+        elif self.grid_mode!='adaptive':
+            raise ValueError("YieldModel: unknown grid_mode %s"%(self.grid_mode))
+        enes=self.uniform_grid()
+        low,high=enes[0],enes[-1]
+        centers,gammas=[],[]
+        if self.has_target() and "beamene" in [*self.bem.keys()]:
+            lt=self.target_lines()
+            centers.append(lt['energy'])
+            gammas.append(lt['width'])
+        for rad in self.rads:
+            rl=self.radionuclide_lines(rad)
+            centers+=[rl['xray_energy'],rl['gamma_energy']]
+            gammas+=[rl['xray_width'],np.full(len(rl['gamma_energy']),1.0)]
+        centers=np.concatenate(centers) if len(centers)>0 else np.zeros(0)
+        gammas=np.concatenate(gammas) if len(gammas)>0 else np.zeros(0)
+        sigma=resolution.fwhm_of(self.detector_resolution,centers)/sigma_from_fwhm
+        fwhms=line_wrap.voigt_fwhm(gammas/2.,sigma)*1e-3# keV
+        zs=[]
+        for mat in [self.tgt]+self.dets+self.bets:
+            if "Elements" in [*mat.keys()]: zs+=list(np.atleast_1d(mat['Elements']))
+        edges=xsection.edge_energies(np.unique(zs),low,high)
+        return egrid.adaptive_grid(low,high,self.er_step,centers[centers>0.],fwhms[centers>0.],edges,
+                                   nwidth=self.profile_window if self.profile_window is not None else 50.)
+
+
+    def to_uniform(self,vals):
+        # values on the model grid resampled to the requested uniform grid
+        if self.grid_mode=='uniform': return vals
+        return egrid.resample(self.enes_keV,vals,self.uniform_grid())
+
+
+    def has_target(self):
+        return "name" in [*self.tgt.keys()]
+
+
+    def cs_material(self,mat,cstype='Total',enes=None):
+        # enes: None for the model grid (cached on disk if a cache is set)
+        if enes is None:
+            if self.cache is not None:
+                return self.cache.cs_material(mat,self.enes_keV,cstype,rtol=self.atten_rtol)
+            enes=self.enes_keV
+        if self.atten_rtol is not None:
+            return xsection.cs_material_loglog(mat,enes,cstype,self.atten_rtol)
+        return xsection.cs_material(mat,enes,cstype)
+
+
+    def atten_check(self):
+        # max relative error of the interpolated cross sections on the model grid
+        # for every filter, detector and target material (0 for direct evaluation)
+        if self.atten_rtol is None: return 0.
+        err=0.
+        for mat in self.bets+self.dets+self.layers():
+            if "Elements" not in [*mat.keys()]: continue
+            for cstype in ['Total','Photo']:
+                err=max(err,xsection.loglog_check(mat,self.enes_keV,cstype,self.atten_rtol))
+        return err
+
+
+    def transmission(self):
+        trans_all=np.ones_like(self.enes_keV,dtype=np.float64)
+        trans_each=[]
+        if len(self.bets)==0:
+            sys.stderr.write('Warning: no filter materials data\n')
+            return trans_all,trans_each
+        if "name" not in [*self.bets[0].keys()]:
+            sys.stderr.write('Warning: no filter materials data\n')
+            return trans_all,trans_each
+        for i,bet in enumerate(self.bets):
+            self.report('transmission',i,len(self.bets))
+            if tabulated.table_name(bet) is not None:# measured transmission
+                each=self.table_values(bet)
+            else:
+                each=self.layer_trans(bet,'Total')
+            trans_each.append(each)
+            trans_all=trans_all*each
+        self.report('transmission',len(self.bets),len(self.bets))
+        return trans_all,trans_each
+
+
+    def layer_trans(self,mat,cstype='Total'):
+        # exp(-mu rho t) of one filter/detector layer on the model grid
+        return self.context.get(('layer',self.grid_key,mat,cstype,self.atten_rtol),
+                                lambda: np.exp(-self.cs_material(mat,cstype)*mat['density']*mat['thickness']))
+
+
+    def table_values(self,mat):
+        # tabulated curve of a layer on the model grid (one interpolation per grid)
+        curve=tabulated.get(tabulated.table_name(mat),self.csvd)
+        return self.context.get(('table',self.grid_key,curve),lambda: curve(self.enes_keV))
+
+
+    def _detector_stack(self,cstype,funcname):
+        phabs_all=np.ones_like(self.enes_keV,dtype=np.float64)
+        phabs_each=[]
+        if len(self.dets)==0:
+            sys.stderr.write('Warning: %s, no detector set\n'%(funcname))
+            return phabs_all,phabs_each
+        if "name" not in [*self.dets[-1].keys()]:
+            sys.stderr.write('Warning: %s, no detector name\n'%(funcname))
+            return phabs_all,phabs_each
+        for i,det in enumerate(self.dets):
+            self.report('detector',i,len(self.dets))
+            if tabulated.table_name(det) is not None:# measured QE
+                each=1.-self.table_values(det)
+            else:
+                each=self.layer_trans(det,cstype)
+            phabs_each.append(1.-each)
+            phabs_all=phabs_all*each
+        self.report('detector',len(self.dets),len(self.dets))
+        phabs_all=1.-phabs_all
+        return phabs_all,phabs_each
+
+
+    def photoel(self):
+        return self._detector_stack('Photo','photoel')
+
+
+    def absall(self):
+        return self._detector_stack('Total','absall')
+
+
+    def qe(self):
+        # quantum efficiency = filter transmission x detector photoabsorption
+        trans_all,trans_each=self.transmission()
+        phabs_all,phabs_each=self.photoel()
+        return {'qe':trans_all*phabs_all,
+                'trans_all':trans_all,'trans_each':trans_each,
+                'phabs_all':phabs_all,'phabs_each':phabs_each}
+
+
+    def layers(self):
+        # target layers, beam side first (one layer: tgt itself)
+        if len(self.tgt_layers)>0: return self.tgt_layers
+        return [self.tgt] if self.has_target() else []
+
+
+    def stack_yield(self,zs,el_inds,enes,Q,beamenes):
+        # yield of every (line, beam energy) summed over the target layers
+        # zs: target elements, el_inds/enes: element index and energy of each line
+        # Q: CS_FluorLine_Kissel (line x beam energy)
+        # in every layer: self-absorption within the layer, and attenuation by
+        # all layers above on the incoming and outgoing paths, computed as
+        # (layer x line x beam energy) arrays
+        layers=self.layers()
+        sin_a,sin_b=self._sin_angles()
+        rt,massfr=self._layer_fractions(zs)
+        mu_0=np.array([self.cs_material(m,'Total',beamenes) for m in layers])
+        mu_1=np.array([self.cs_material(m,'Total',enes) for m in layers])
+        x=(mu_0[:,np.newaxis,:]/sin_a+mu_1[:,:,np.newaxis]/sin_b)*rt[:,np.newaxis,np.newaxis]
+        above=np.cumsum(x,axis=0)-x
+        A_corr=np.where(x>0.,-np.expm1(-x)/np.where(x>0.,x,1.),1.)
+        w=massfr[:,el_inds]*rt[:,np.newaxis]
+        return Q*np.sum(w[:,:,np.newaxis]*A_corr*np.exp(-above),axis=0)
+
+
+    def _sin_angles(self):
+        return (np.sin(np.pi/180.*self.bem.get('beamalpha',45.)),
+                np.sin(np.pi/180.*self.bem.get('beambeta',45.)))
+
+
+    def _layer_fractions(self,zs):
+        # mass thickness (g/cm2) and mass fraction of every element zs per layer
+        layers=self.layers()
+        zs=np.asarray(zs,dtype=np.int64)
+        rt=np.array([m['density']*m['thickness'] for m in layers],dtype=np.float64)
+        massfr=np.zeros((len(layers),len(zs)),dtype=np.float64)
+        for l,m in enumerate(layers):
+            for z,w in zip(np.atleast_1d(m['Elements']),np.atleast_1d(m['massFractions'])):
+                massfr[l,zs==z]=w
+        return rt,massfr
+
+
+    def secondary_yield(self,zs,el_inds,line_inds,lines,enes,beamenes):
+        # secondary fluorescence of every (line, beam energy), same order as
+        # beam_scan; the exciting lines are the same lines
+        # memoized per layers, beam energies and geometry: redraws and line
+        # toggles reuse it
+        return self.context.get(('secondary',self.layers(),np.asarray(beamenes,dtype=np.float64),
+                                 self._sin_angles(),zs,lines,self.atten_rtol),
+                                lambda: self._secondary_yield(zs,el_inds,line_inds,lines,enes,beamenes))
+
+
+    def _secondary_yield(self,zs,el_inds,line_inds,lines,enes,beamenes):
+        # within each layer and from every other layer (lines of layer a
+        # absorbed in layer b), attenuated by the layers above like the
+        # primary yield
+        layers=self.layers()
+        sin_a,sin_b=self._sin_angles()
+        rt,massfr=self._layer_fractions(zs)
+        Q=xsection.fluorline_kissel(zs,lines,beamenes)[el_inds,line_inds,:]
+        F=xsection.fluorline_kissel(zs,lines,enes)[el_inds,line_inds,:]# (excited, exciting)
+        mu_0=np.array([self.cs_material(m,'Total',beamenes) for m in layers])
+        mu_1=np.array([self.cs_material(m,'Total',enes) for m in layers])
+        x=(mu_0[:,np.newaxis,:]/sin_a+mu_1[:,:,np.newaxis]/sin_b)*rt[:,np.newaxis,np.newaxis]
+        above=np.cumsum(x,axis=0)-x
+        y=np.zeros((len(enes),len(beamenes)),dtype=np.float64)
+        n=len(layers)
+        for l in range(n):
+            self.report('secondary',l*n,n*n)
+            w=massfr[l,el_inds]
+            y+=secondary.enhancement(Q,w,F,mu_0[l],mu_1[l],rt[l],sin_a,sin_b)*np.exp(-above[l])
+        if n>1:
+            # beam down to layer a, line i up from layer b, line j in between
+            xb=mu_0/sin_a*rt[:,np.newaxis]
+            xi=mu_1/sin_b*rt[:,np.newaxis]
+            beam_above,exit_above=np.cumsum(xb,axis=0)-xb,np.cumsum(xi,axis=0)-xi
+            od=mu_1*rt[:,np.newaxis]
+            pairs=[(a,b) for a in range(n) for b in range(n) if a!=b]
+            for k,(a,b) in enumerate(pairs):
+                self.report('secondary',n+k,n*n)
+                between=np.sum(od[min(a,b)+1:max(a,b)],axis=0)
+                yab=secondary.cross_enhancement(Q,massfr[a,el_inds],massfr[b,el_inds],F,mu_0[a],mu_1[a],mu_1[b],
+                                                between,rt[a],rt[b],b>a,sin_a,sin_b)
+                y+=yab*np.exp(-beam_above[a])[np.newaxis,:]*np.exp(-exit_above[b])[:,np.newaxis]
+        self.report('secondary',n*n,n*n)
+        return y
+
+
+    def beam_bins(self):
+        # incident energies and fraction of the beam flux in each
+        # (monochromatic: beamene with weight 1)
+        return self.context.get(('beam_bins',self._beam_key()),lambda: beam_spectrum.bins(self.bem,self.csvd))
+
+
+    def _beam_key(self):
+        # beam dict in memo keys, with the file stamp of a table spectrum
+        # (an edited csv is read again)
+        return (self.bem,self.csvd,beam_spectrum.table_stamp(self.bem.get('spectrum'),self.csvd))
+
+
+    def xrf_intensity(self,z,line):
+        # yield of one target line (same normalization as target_lines)
+        if not self.has_target():
+            sys.stderr.write('Error: xrf_intensity, tgt has no name\n')
+            return 0.
+        beamenes,weights=self.beam_bins()
+        zs=np.array([*self.tgt['Elements']],dtype=np.int64)
+        el_inds=np.where(zs==z)[0][:1]
+        if len(el_inds)==0: return 0.
+        if self.secondary:
+            # the enhancement needs all exciting lines: take it from the scan
+            sc=self.beam_scan(beamenes,linetypes=self.linedb.linetypes if self.all_lines else None)
+            k=np.where((sc['el_ind']==el_inds[0]) & (sc['line']==int(line)))[0]
+            if len(k)>0: return np.dot(sc['yield'][k[0]],weights)
+        Q=xsection.fluorline_kissel([z],[int(line)],beamenes)[0]
+        return np.dot(self.stack_yield(zs,el_inds,[self.linedb.line_energy(z,line)],Q,beamenes)[0],weights)
+
+
+    def target_lines(self):
+        # per-line table of the target fluorescence, non-valid lines removed
+        if not self.has_target():
+            sys.stderr.write('Warning: target_lines, tgt has no name\n')
+            return None
+        return self.context.get(('target_lines',self.tgt,self.tgt_layers,self._beam_key(),self.atten_rtol,
+                                 self.all_lines,self.line_threshold,self.secondary),self._target_lines)
+
+
+    def _target_lines(self):
+        if self.all_lines: return self._target_lines_all()
+        # polychromatic beam: yield map (line x incident bin) times the weights
+        beamenes,weights=self.beam_bins()
+        sc=self.beam_scan(beamenes)
+        intens=np.dot(sc['yield'],weights)
+        zs=np.array([*self.tgt['Elements']],dtype=np.int64)
+        gammas=self.linedb.width[zs[sc['el_ind']],self.linedb.cols_of_types(sc['linetype'])]*1e3# eV
+        # remove non-valid lines
+        indx=np.where(intens!=0.)[0]
+        return {'el':sc['el'][indx],'el_ind':sc['el_ind'][indx],
+                'linetype':sc['linetype'][indx],'sgblinetype':sc['sgblinetype'][indx],
+                'energy':sc['energy'][indx],'width':gammas[indx],'intensity':intens[indx],
+                'name':self.tgt['name']}
+
+
+    def _target_lines_all(self):
+        # polychromatic beam: yield map (line x incident bin) times the weights
+        beamenes,weights=self.beam_bins()
+        sc=self.beam_scan(beamenes,linetypes=self.linedb.linetypes)
+        intens=np.dot(sc['yield'],weights)
+        zs=np.array([*self.tgt['Elements']],dtype=np.int64)
+        gammas=self.linedb.width[zs[sc['el_ind']],self.linedb.cols_of_types(sc['linetype'])]*1e3# eV
+        indx=np.where(intens>0.)[0]
+        if len(indx)>0: indx=indx[intens[indx]>=self.line_threshold*np.max(intens[indx])]
+        return {'el':sc['el'][indx],'el_ind':sc['el_ind'][indx],
+                'linetype':sc['linetype'][indx],'sgblinetype':sc['sgblinetype'][indx],
+                'energy':sc['energy'][indx],'width':gammas[indx],'intensity':intens[indx],
+                'name':self.tgt['name']}
+
+
+    def beam_scan(self,beamenes,linetypes=None):
+        # line intensities of the target for every incident energy in one pass
+        # linetypes: IUPAC line types (default LINES), labelled in Siegbahn
+        #            notation where available
+        # return: line labels and a (line x beam energy) yield map, same
+        #         normalization as xrf_intensity
+        if not self.has_target():
+            sys.stderr.write('Warning: beam_scan, tgt has no name\n')
+            return None
+        beamenes=np.atleast_1d(np.asarray(beamenes,dtype=np.float64))
+        zs=np.array([*self.tgt['Elements']],dtype=np.int64)
+        if linetypes is None: linetypes=LINES
+        lines=self.linedb.lines[self.linedb.cols_of_types(linetypes)]
+        sgb=dict(zip(LINES,SGBLINES))
+        # (line, element) flattened in the same order as target_lines
+        sgblinetypes=np.array([sgb.get(l,l) for l in linetypes for z in zs])
+        linetypes=np.array([l for l in linetypes for z in zs])
+        els=np.array([xrl.AtomicNumberToSymbol(int(z)) for l in lines for z in zs])
+        el_inds=np.array([i for l in lines for i,z in enumerate(zs)])
+        line_inds=np.array([j for j,l in enumerate(lines) for z in zs])
+        enes=self.linedb.lookup('energy',zs,lines).ravel()
+        indx=np.where(enes>0.)[0]
+        el_inds,line_inds,enes=el_inds[indx],line_inds[indx],enes[indx]
+        # excitation: CS_FluorLine_Kissel for all (element, line, beam energy)
+        Q=xsection.fluorline_kissel(zs,lines,beamenes)[el_inds,line_inds,:]
+        # self-absorption and layers above, vectorized over lines and beam energies
+        yields=self.stack_yield(zs,el_inds,enes,Q,beamenes)
+        if self.secondary:
+            yields=yields+self.secondary_yield(zs,el_inds,line_inds,lines,enes,beamenes)
+        return {'beamene':beamenes,'yield':yields,
+                'el':els[indx],'el_ind':el_inds,'line':lines[line_inds],
+                'linetype':linetypes[indx],'sgblinetype':sgblinetypes[indx],
+                'energy':enes,'name':self.tgt['name']}
+
+
+    def radionuclide_lines(self,rad):
+        # per-line table of a radionuclide source (x-rays and gamma-rays, per decay)
+        return self.nuclide_lines(rad['name'])
+
+
+    def nuclide_lines(self,name):
+        # one memo entry per nuclide: activity, date and duration only scale it
+        return self.context.get(('radionuclide_lines',name),lambda: self._nuclide_lines(name))
+
+
+    def _nuclide_lines(self,name):
+        nd=nuclide(name)
+        cols=self.linedb.cols(nd['xray_lines'])
+        return {'name':name,'elXray':xrl.AtomicNumberToSymbol(nd['Z_xray']),
+                'xray_linetype':self.linedb.linetypes[cols],
+                'xray_energy':self.linedb.energy[nd['Z_xray'],cols],
+                'xray_width':self.linedb.width[nd['Z_xray'],cols]*1e3,# eV
+                'xray_intensity':nd['xray_intensity'],
+                'gamma_energy':nd['gamma_energy'],'gamma_intensity':nd['gamma_intensity']}
+
+
+    def line_spectrum(self,enes,gammas,norms):
+        # sum of Voigt profiles on the grid (no efficiency applied)
+        # enes: keV, gammas: natural width FWHM (eV)
+        self._track_profile_error(enes,gammas)
+        return self._line_spectrum(enes,gammas,norms)
+
+
+    def _track_profile_error(self,enes,gammas):
+        # tail='lorentz' keeps the far Voigt tail (its Lorentzian asymptote),
+        # only tail='cut' loses area outside the window
+        if self.profile_method=='fft' or self.profile_window is None or len(gammas)==0: return
+        if self.profile_tail=='lorentz': return
+        sigma=resolution.fwhm_of(self.detector_resolution,np.asarray(enes,dtype=np.float64))/sigma_from_fwhm
+        err=np.max(line_wrap.voigt_window_error(np.asarray(gammas)/2.,sigma,self.profile_window))
+        self.profile_error=max(self.profile_error,err)
+
+
+    def _line_spectrum(self,enes,gammas,norms):
+        enes=np.asarray(enes,dtype=np.float64)
+        sigma=resolution.fwhm_of(self.detector_resolution,enes)/sigma_from_fwhm
+        hwhms=np.asarray(gammas)/2.
+        if self.profile_method=='fft':
+            # the convolution needs a uniform grid anyway: the requested er_step
+            # grid (the smallest adaptive spacing would make it far too long),
+            # resampled onto the model grid (cubic, the result is smooth on
+            # the scale of the resolution)
+            enes_u=self.uniform_grid()
+            spec=line_wrap.fft_spectrum(enes_u*1e3,np.asarray(enes)*1e3,hwhms,norms,sigma,
+                                        tail_tau=self.tail_tau,tail_frac=self.tail_frac)
+            if self.grid_mode=='uniform': return spec
+            return np.maximum(egrid.resample(enes_u,spec,self.enes_keV,kind='cubic'),0.)
+        return line_wrap.voigt_sum(self.enes_keV*1e3,np.asarray(enes)*1e3,hwhms,sigma,norms,
+                                   window=self.profile_window,tail=self.profile_tail)
+
+
+    def cached_line_spectrum(self,enes,gammas,norms):
+        # line_spectrum memoized in the context
+        args=('line_spectrum',self.grid_key,self.detector_resolution,self.profile_method,
+              self.profile_window,self.profile_tail,self.tail_tau,self.tail_frac,
+              np.asarray(enes,dtype=np.float64),np.asarray(gammas,dtype=np.float64),
+              np.asarray(norms,dtype=np.float64))
+        return self.context.get(args,lambda: self._line_spectrum(enes,gammas,norms))
+
+
+    def group_spectrum(self,enes,gammas,norms,drawn):
+        # spectrum of the drawn lines of one component: all lines of the
+        # component minus the hidden ones (or the sum of the drawn ones if
+        # most are hidden), each cached, so toggling a line costs one line
+        enes,gammas,norms=[np.asarray(a,dtype=np.float64) for a in (enes,gammas,norms)]
+        drawn=np.asarray(drawn,dtype=bool)
+        shown,hidden=np.where(drawn)[0],np.where(~drawn)[0]
+        self._track_profile_error(enes[shown],gammas[shown])
+        if len(shown)==0: return np.zeros_like(self.enes_keV)
+        if len(hidden)==0 or self.profile_method=='fft':
+            # fft: lines are grouped by width, not exactly additive line by line
+            return self.cached_line_spectrum(enes[shown],gammas[shown],norms[shown])
+        if len(hidden)<=len(shown):
+            spec=self.cached_line_spectrum(enes,gammas,norms).copy()
+            for i in hidden: spec-=self.cached_line_spectrum(enes[i:i+1],gammas[i:i+1],norms[i:i+1])
+            return np.maximum(spec,0.)
+        spec=np.zeros_like(self.enes_keV)
+        for i in shown: spec+=self.cached_line_spectrum(enes[i:i+1],gammas[i:i+1],norms[i:i+1])
+        return spec
+
+
+    def fluorescence(self,eff=None):
+        # eff: detection efficiency on the grid (trans_all*phabs_all)
+        # return: total spectrum and a list of components
+        #         (label, spectrum, kind) with kind in target/xray/gamma
+        if eff is None: eff=self.qe()['qe']
+        flout=np.zeros_like(self.enes_keV)
+        components=[]
+        solidangle=self.detector_solidangle
+        names=[]# distinct nuclides of the radionuclide sources
+        for rad in self.rads:
+            if rad['name'] not in names: names.append(rad['name'])
+        ncomp=(len(self.tgt['Elements']) if self.has_target() else 0)+2*len(names)
+        self.report('lines',0,1+len(names))
+        if self.has_target():
+            flux=self.bem['beamflux']
+            beamtimesec=self.beam_duration# sec
+            zs=[*self.tgt['Elements']]
+            lt=self.target_lines()
+            drawn=np.array([el+sgblt not in self.not_draw_lines for el,sgblt in zip(lt['el'],lt['sgblinetype'])],dtype=bool)
+            valid=(lt['energy']>0.) & (lt['width']>0.)
+            for elind,z in enumerate(zs):
+                self.report('profiles',len(components),ncomp)
+                k=np.where(valid & (lt['el_ind']==elind))[0]
+                spec=flux * beamtimesec * solidangle * eff * self.group_spectrum(lt['energy'][k],lt['width'][k],lt['intensity'][k],drawn[k])
+                flout+=spec
+                components.append((xrl.AtomicNumberToSymbol(z),spec,'target'))
+        else:
+            sys.stderr.write('Warning: fluorescence, no target set\n')
+        # radionuclide sources: x-ray and gamma spectra per decay once per
+        # nuclide, then all sources in one product (source x nuclide weights)
+        units=np.zeros((2,len(names),len(self.enes_keV)),dtype=np.float64)
+        for n,name in enumerate(names):
+            self.report('lines',1+n,1+len(names))
+            self.report('profiles',len(components)+2*n,ncomp)
+            rl=self.nuclide_lines(name)
+            # Xray
+            drawn=np.array([rl['elXray']+lt not in self.not_draw_lines for lt in rl['xray_linetype']],dtype=bool)
+            k=np.where((rl['xray_energy']>0.) & (rl['xray_width']>0.) & (rl['xray_intensity']>0.))[0]
+            units[0,n]=self.group_spectrum(rl['xray_energy'][k],rl['xray_width'][k],rl['xray_intensity'][k],drawn[k])
+            # Gamma-ray
+            k=np.where((rl['gamma_energy']>0.) & (rl['gamma_intensity']>0.))[0]
+            drawn=np.full(len(k),name+"Gamma" not in self.not_draw_lines)
+            units[1,n]=self.group_spectrum(rl['gamma_energy'][k],np.full(len(k),1.0),rl['gamma_intensity'][k],drawn)
+        if len(self.rads)>0:
+            weights=np.zeros((len(self.rads),len(names)),dtype=np.float64)
+            for i,rad in enumerate(self.rads):
+                weights[i,names.index(rad['name'])]=rad['activitytoday']*self.rad_duration*solidangle
+            specX=np.dot(weights,units[0])*eff
+            specG=np.dot(weights,units[1])*eff
+            flout+=specX.sum(axis=0)+specG.sum(axis=0)
+            for i,rad in enumerate(self.rads):
+                components.append((xrl.AtomicNumberToSymbol(nuclide(rad['name'])['Z_xray']),specX[i],'xray'))
+                components.append((rad['name'],specG[i],'gamma'))
+        self.report('profiles',ncomp,ncomp)
+        return flout,components
+
+
+    def run(self):
+        # QE curves, fluorescence spectrum and line tables in one call
+        out=self.qe()
+        out['enes_keV']=self.enes_keV
+        out['fluor'],out['components']=self.fluorescence(eff=out['qe'])
+        out['profile_error']=self.profile_error
+        out['target_lines']=self.target_lines() if self.has_target() else None
+        out['radionuclide_lines']=[self.radionuclide_lines(rad) for rad in self.rads]
+        return out
+
+
+    # everything a result depends on (result metadata)
+    CONFIG_KEYS=['tgt','tgt_layers','dets','bets','bem','rads','er_low','er_high','er_step',
+                 'detector_resolution','detector_solidangle','beam_duration','rad_duration',
+                 'not_draw_lines','profile_window','profile_tail','profile_method',
+                 'tail_tau','tail_frac','grid_mode','atten_rtol','all_lines','line_threshold','secondary']
+
+    def config(self):
+        cfg={k:_plain(getattr(self,k)) for k in self.CONFIG_KEYS}
+        cfg['xraylib_version']=xrl.__version__
+        return cfg
+
+
+    def line_spectra(self,eff=None):
+        # spectrum of every line (efficiency applied, drawn or not)
+        # return: labels and a generator of the spectra in the same order, so
+        #         that a writer can stream them one line at a time
+        if eff is None: eff=self.qe()['qe']
+        items=[]
+        solidangle=self.detector_solidangle
+        if self.has_target():
+            lt=self.target_lines()
+            scale=self.bem['beamflux']*self.beam_duration*solidangle
+            for i in np.where((lt['energy']>0.) & (lt['width']>0.))[0]:
+                items.append(("%s_%s"%(lt['el'][i],lt['sgblinetype'][i]),lt['energy'][i],lt['width'][i],scale*lt['intensity'][i]))
+        for rad in self.rads:
+            rl=self.radionuclide_lines(rad)
+            scale=rad['activitytoday']*self.rad_duration*solidangle
+            for e,w,n,lt in zip(rl['xray_energy'],rl['xray_width'],rl['xray_intensity'],rl['xray_linetype']):
+                if e>0. and w>0. and n>0.: items.append(("%s_%s"%(rl['elXray'],lt),e,w,scale*n))
+            for e,n in zip(rl['gamma_energy'],rl['gamma_intensity']):
+                if e>0. and n>0.: items.append(("%s_gamma_%.3f"%(rl['name'],e),e,1.0,scale*n))
+        labels=[it[0] for it in items]
+        return labels,(eff*self._line_spectrum([e],[w],[n]) for label,e,w,n in items)
+
+
+def stack_spec(layers):
+    # summary of a layered target: names beam side first, elements of all layers
+    zs=[]
+    for mat in layers:
+        for z in np.atleast_1d(mat['Elements']):
+            if int(z) not in zs: zs.append(int(z))
+    return {'name':'/'.join([str(mat['name']) for mat in layers]),'Elements':zs,
+            'thickness':float(sum([mat['thickness'] for mat in layers])),'nlayers':len(layers)}
+
+
+def material_spec(name,thickness,density=-1):
+    # element (density -1: xraylib element density) or compound parser formula
+    if float(density)<0:
+        Z=xrl.SymbolToAtomicNumber(name)
+        mat=xrl.CompoundParser(xrl.AtomicNumberToSymbol(Z))
+        mat['name']=xrl.AtomicNumberToSymbol(Z)
+        mat['density']=xrl.ElementDensity(Z)
+    else:
+        mat=xrl.CompoundParser(name)
+        mat['name']=name
+        mat['density']=float(density)
+    mat['thickness']=float(thickness)
+    return mat
+
+
+def nist_spec(index,thickness):
+    mat=xrl.GetCompoundDataNISTByIndex(int(index))
+    mat['thickness']=float(thickness)
+    return mat
+
+
+_NUCLIDES={}
+
+def nuclide(name):
+    # GetRadioNuclideDataByIndex decoded once per nuclide into compact arrays
+    # (shared: do not modify; 'record' is the xraylib dict for rad specs)
+    if name not in _NUCLIDES:
+        rdnlist=list(xrl.GetRadioNuclideDataList())
+        i=rdnlist.index(name)
+        rad=xrl.GetRadioNuclideDataByIndex(i)
+        _NUCLIDES[name]={'name':name,'record':rad,'halflife':RDNHL[i],'Z_xray':int(rad['Z_xray']),
+                         'xray_lines':np.asarray(rad['XrayLines'],dtype=np.int64),
+                         'xray_intensity':np.asarray(rad['XrayIntensities'],dtype=np.float64),
+                         'gamma_energy':np.asarray(rad['GammaEnergies'],dtype=np.float64),
+                         'gamma_intensity':np.asarray(rad['GammaIntensities'],dtype=np.float64)}
+    return _NUCLIDES[name]
+
+
+def radionuclide_spec(name,activity,date_calib,now=None):
+    # activity (Bq) at date_calib (e.g., 20110311) decayed to now
+    if now is None: now=datetime.now()
+    nd=nuclide(name)
+    rad=copy.deepcopy(nd['record'])
+    hl=nd['halflife']
+    st=str(date_calib)
+    dt=(now-datetime(int(st[0:4]),int(st[4:6]),int(st[6:8]))).total_seconds()/86400.# days
+    rad['activity']=float(activity)
+    rad['date']=st
+    rad['deltadays']=dt
+    rad['halflife']=hl
+    rad['activitytoday']=float(activity) * np.exp(-np.log(2)/hl * dt)
+    return rad
+
+
+def model_from_default(dic,**kwargs):
+    # dic: default.read_default_csv output, kwargs are passed to YieldModel
+    # (same interpretation as ApplicationWindow._set_from_file)
+    # several targets: layers, beam side first
+    layers=[material_spec(dic['target'][i],dic['target_thickness'][i],dic['target_density'][i])
+            for i in range(len(dic['target']))]
+    tgt=layers[0] if len(layers)==1 else {}
+    dets=[material_spec(dic['detector'][i],dic['detector_thickness'][i],dic['detector_density'][i])
+          for i in range(len(dic['detector']))]
+    bets=[material_spec(dic['filter_materials'][i],dic['filter_mat_thickness'][i],dic['filter_mat_density'][i])
+          for i in range(len(dic['filter_materials']))]
+    bets+=[nist_spec(dic['NIST_CP_ID'][i],dic['NIST_CP_thickness'][i])
+           for i in range(len(dic['NIST_CP_ID']))]
+    rads=[radionuclide_spec(dic['radionuclide'][i],dic['activity_calib'][i],dic['date_calib'][i])
+          for i in range(len(dic['radionuclide']))]
+    bem={'beamene':float(dic['beam_energy'][0]),
+         'beamalpha':float(dic['beam_alpha'][0]),
+         'beambeta':float(dic['beam_beta'][0]),
+         'beamflux':float(dic['beam_flux'][0])}
+    # optional incident spectrum (tube,W,50,Be,127 or table,file.csv)
+    if len(dic.get('beam_spectrum',[]))>0:
+        bem['spectrum']=beam_spectrum.from_entry(dic['beam_spectrum'])
+        bem['beamene']=beam_spectrum.max_energy(bem['spectrum'],kwargs.get('csvd',"./csv/"))
+    kw={'detector_resolution':float(dic['detector_resolution'][0]),
+        'detector_solidangle':float(dic['detector_solidangle'][0]),
+        'beam_duration':float(dic['beam_time'][0])}
+    if len(layers)>1: kw['tgt_layers']=layers
+    # optional measured curves (built-in names or csv files)
+    bets+=[tabulated.layer_from(e,kwargs.get('csvd',"./csv/")) for e in dic.get('filter_table',[])]
+    dets+=[tabulated.layer_from(e,kwargs.get('csvd',"./csv/")) for e in dic.get('detector_table',[])]
+    if len(dic['radio_time'])>0: kw['rad_duration']=float(dic['radio_time'][-1])
+    # optional energy dependent resolution
+    if len(dic.get('resolution_model',[]))>0:
+        kw['detector_resolution']=resolution.from_spec(dic['resolution_model'],kw['detector_resolution'])
+    # optional detector response tail
+    if len(dic.get('tail_tau',[]))>0 and len(dic.get('tail_frac',[]))>0:
+        kw['profile_method']='fft'
+        kw['tail_tau']=float(dic['tail_tau'][0])
+        kw['tail_frac']=float(dic['tail_frac'][0])
+    kw.update(kwargs)
+    return YieldModel(tgt=tgt,dets=dets,bets=bets,bem=bem,rads=rads,**kw)